@@ -1,13 +1,14 @@
 #!/usr/bin/env python3
+import argparse
 import logging
 import os
 import random
+import sys
 import options
 
-
-from cassandra.cluster import Cluster
-
+import batch
 import model
+import query_metrics
 
 # Set logger
 log = logging.getLogger()
@@ -19,6 +20,12 @@ log.addHandler(handler)
 # Read env vars releated to Cassandra App
 CLUSTER_IPS = os.getenv('CASSANDRA_CLUSTER_IPS', 'localhost')
 KEYSPACE = os.getenv('CASSANDRA_KEYSPACE', 'investments')
+COMPRESSION = os.getenv('CASSANDRA_COMPRESSION', 'none')
+LOCAL_DC = os.getenv('CASSANDRA_LOCAL_DC')
+PROTOCOL_VERSION = os.getenv('CASSANDRA_PROTOCOL_VERSION')
+CONNECTIONS_PER_HOST = os.getenv('CASSANDRA_CONNECTIONS_PER_HOST')
+DRIVER_METRICS = os.getenv('CASSANDRA_DRIVER_METRICS', '0') == '1'
+METRICS_INTERVAL = int(os.getenv('CASSANDRA_METRICS_INTERVAL', '60'))
 REPLICATION_FACTOR = os.getenv('CASSANDRA_REPLICATION_FACTOR', '1')
 
 
@@ -49,103 +56,166 @@ def print_menu():
         21: "Show flights by percentage for a specific airline and date",
         22: "Show better month to hire on specific airline and year",
         23: "Exit",
+        24: "Show cache statistics",
+        25: "Show query metrics",
     }
     for key in mm_options.keys():
         print(key, '--', mm_options[key])
 
 
 
+def ask_next_page():
+    return input('Show next page? (y/n): ').strip().lower() != 'n'
+
+
+def render_rows(rows):
+    # Interactivo: una tabla por pagina. Redirigido a archivo: texto plano en streaming
+    if sys.stdout.isatty():
+        model.print_pages(rows, ask_next_page)
+    else:
+        model.write_rows(rows, sys.stdout)
+
+
 def get_instrument_value(instrument):
     instr_mock_sum = sum(bytearray(instrument, encoding='utf-8'))
     return random.uniform(1.0, instr_mock_sum)
 
 
-def main():
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-b", "--batch",
+            help="Run the queries listed in this file (option,param,...) instead of the interactive menu")
+    parser.add_argument("-f", "--format", choices=["jsonl", "csv"],
+            help="Output format for batch mode, defaults to: jsonl", default="jsonl")
+    parser.add_argument("-o", "--output",
+            help="Output file for batch mode, defaults to stdout")
+    parser.add_argument("-c", "--concurrency",
+            help="Batch queries in flight at the same time, defaults to: 32", type=int, default=32)
+    parser.add_argument("--backend", choices=["cassandra", "local"],
+            help="local answers the menu from a file with NumPy, without Cassandra, defaults to: cassandra", default="cassandra")
+    parser.add_argument("--data",
+            help="CSV or .npz snapshot for --backend=local, defaults to: flight_passengers.csv", default="flight_passengers.csv")
+    args = parser.parse_args()
+    if args.backend == "local" and args.batch:
+        parser.error("--batch needs the cassandra backend")
+    return args
+
+
+def run_batch(session, statements, args):
+    out = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        latencies = batch.run(session, statements, args.batch, args.format, out, args.concurrency)
+    finally:
+        if args.output:
+            out.close()
+    if latencies:
+        print(f"{len(latencies)} queries, mean latency {sum(latencies) / len(latencies):.1f} ms, max {max(latencies):.1f} ms", file=sys.stderr)
+
+
+def connect():
     log.info("Connecting to Cluster")
-    cluster = Cluster(CLUSTER_IPS.split(','))
+    cluster = model.create_cluster(CLUSTER_IPS.split(','), COMPRESSION, LOCAL_DC, PROTOCOL_VERSION, CONNECTIONS_PER_HOST,
+                                   DRIVER_METRICS)
     session = cluster.connect()
 
     model.create_keyspace(session, KEYSPACE, REPLICATION_FACTOR)
     session.set_keyspace(KEYSPACE)
 
     model.create_schema(session)
+    statements = model.prepare_statements(session)
+    query_metrics.instrument(session, statements, METRICS_INTERVAL)
+    return cluster, session, statements
+
 
-    
+def main():
+    args = parse_args()
+    if args.backend == "local":
+        # Mismas funciones de consulta, el "session" es el almacen en columnas
+        import columnar
+        queries = columnar
+        cluster, session, statements = None, columnar.FlightStore.load(args.data), None
+    else:
+        queries = model
+        cluster, session, statements = connect()
+
+    if args.batch:
+        run_batch(session, statements, args)
+        query_metrics.metrics.log_summary()
+        cluster.shutdown()
+        return
 
-    
-    
     while(True):
         print_menu()
         print("\nCopy and paste when there are given options\n")
         option = int(input('Enter your choice: '))
         if option == 1:
-            model.select_all(session)
+            queries.select_all(session, statements, render=render_rows)
 
         elif option == 2:
             options.print_airlines()
             airline_name = input('Enter airline name: ')
-            model.select_by_airline(session,airline_name)
+            queries.select_by_airline(session, statements, airline_name, render=render_rows)
 
         elif option == 3:
             options.print_airlines()
             airline_name = input('Enter airline name: ')
             wait_time = int(input('Enter wait time: '))
-            model.select_by_airline_wait(session,airline_name, wait_time)
+            queries.select_by_airline_wait(session, statements, airline_name, wait_time, render=render_rows)
 
         elif option == 4:
             options.print_wait()
             wait_option = int(input('Enter your wait choice: '))
             if wait_option == 1:
                 wait_time = int(input('Enter wait time: '))
-                model.select_by_wait_less_0(session,wait_time)
+                queries.select_by_wait_less_0(session, statements, wait_time, render=render_rows)
             elif wait_option == 2:
                 wait_time = int(input('Enter wait time: '))
-                model.select_by_wait_more_0(session,wait_time)
+                queries.select_by_wait_more_0(session, statements, wait_time, render=render_rows)
 
         elif option == 5:
             month = int(input('Enter month: '))
             year = int(input('Enter year: '))
-            model.select_by_month_year(session, month, year)
+            queries.select_by_month_year(session, statements, month, year, render=render_rows)
 
         elif option == 6:
             options.print_airports()
             origin = input('Enter origin airport: ')
             destination = input('Enter destination airport: ')
-            model.select_by_from_to(session,origin, destination)
+            queries.select_by_from_to(session, statements, origin, destination, render=render_rows)
 
         elif option == 7:
             options.print_airports()
             origin = input('Enter origin airport: ')
             destination = input('Enter destination airport: ')
             wait_time = int(input('Enter wait time: '))
-            model.select_by_from_to_wait(session,origin, destination, wait_time)
+            queries.select_by_from_to_wait(session, statements, origin, destination, wait_time, render=render_rows)
             
         elif option == 8:
             options.print_stays()
             stay_option = input('Enter stay option:')
             options.print_yes_no()
             connection = input('Enter connection option: ')
-            model.select_by_stay_connection(session, stay_option,connection)
+            queries.select_by_stay_connection(session, statements, stay_option,connection, render=render_rows)
 
         elif option == 9:
             options.print_airlines()
             airline_name = input('Enter airline name: ')
             options.print_airports()
             origin = input('Enter origin airport: ')
-            model.select_by_airline_from(session,airline_name, origin)
+            queries.select_by_airline_from(session, statements, airline_name, origin, render=render_rows)
 
         elif option == 10:
             wait_time = int(input('Enter wait time: '))
             options.print_transits()
             transit_option = input('Enter transit option: ')
-            model.select_by_transit_wait(session, transit_option, wait_time)
+            queries.select_by_transit_wait(session, statements, transit_option, wait_time, render=render_rows)
 
         elif option == 11:
             options.print_airports()
             origin = input('Enter origin airport: ')
             destination = input('Enter destination airport: ')
             month = int(input('Enter month: '))
-            model.select_by_from_to_month(session, origin, destination, month)
+            queries.select_by_from_to_month(session, statements, origin, destination, month, render=render_rows)
 
         elif option == 12:
             date = input('Enter date (dd-mm-yyyy): ')
@@ -153,43 +223,43 @@ def main():
             day = int(day)
             month = int(month)
             year = int(year)
-            model.select_by_percentaje_date(session,day,month,year)
+            queries.select_by_percentaje_date(session, statements, day,month,year)
 
         elif option == 13:
             day = int(input('Enter day of the month: '))
-            model.select_by_percentaje_day(session, day)
+            queries.select_by_percentaje_day(session, statements, day)
 
         elif option == 14:
             wait_time = int(input('Enter wait time: '))
-            model.select_by_percentaje_less_wait(session,wait_time)
+            queries.select_by_percentaje_less_wait(session, statements, wait_time)
 
         elif option == 15:
             wait_time = int(input('Enter wait time: '))
-            model.select_by_percentaje_more_wait(session, wait_time)
+            queries.select_by_percentaje_more_wait(session, statements, wait_time)
 
         elif option == 16:
             options.print_airports()
             airport_code = input('Enter airport name (Origin): ')
             day = int(input('Enter day of the month: '))
-            model.select_by_percentaje_to_day(session,day,airport_code)
+            queries.select_by_percentaje_to_day(session, statements, day,airport_code)
 
         elif option == 17:
             options.print_airports()
             airport_code = input('Enter airport name (Origin): ')
             month = int(input('Enter month mm: '))
-            model.select_by_percentaje_to_month(session, month,airport_code)
+            queries.select_by_percentaje_to_month(session, statements, month,airport_code)
         
         elif option == 18:
             options.print_airports()
             airport_code = input('Enter airport name (Origin): ')
             year = int(input('Enter year yyyy: '))
-            model.select_by_percentaje_to_year(session,year,airport_code)
+            queries.select_by_percentaje_to_year(session, statements, year,airport_code)
         
         elif option == 19:
-            model.select_by_percentaje_connection_true(session)
+            queries.select_by_percentaje_connection_true(session, statements)
         
         elif option == 20:
-            model.select_by_percentaje_connection_false(session)
+            queries.select_by_percentaje_connection_false(session, statements)
 
         elif option == 21:
             options.print_airlines()
@@ -199,19 +269,28 @@ def main():
             day = int(day)
             month = int(month)
             year = int(year)
-            model.select_by_percentaje_airline_date(session,airline,day,month,year)
+            queries.select_by_percentaje_airline_date(session, statements, airline,day,month,year)
 
         elif option == 22:
             year = int(input('Enter year: '))
 
             options.print_airlines()
             airline = input('Enter Airline: ')
-            model.select_by_query_main(session,year,airline)
+            queries.select_by_query_main(session, statements, year,airline)
+
+        elif option == 24:
+            model.print_cache_stats()
+
+        elif option == 25:
+            query_metrics.print_stats(cluster)
 
         elif option == 23:
             print("Exiting...")
             break;
 
+    if cluster is not None:
+        cluster.shutdown()
+
 
 if __name__ == '__main__':
     main()
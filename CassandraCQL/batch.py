@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Modo por lotes de app.py: ejecuta las consultas del menu leidas de un archivo
+y escribe los resultados como JSON Lines o CSV, sin colorama ni tabulate.
+
+Cada linea del archivo es la opcion del menu seguida de sus parametros,
+separados por comas. Las lineas vacias o que empiezan con # se ignoran:
+
+    2,Volaris
+    4,1,120
+    12,22-05-2020
+    22,2020,Aeromexico
+"""
+import collections
+import csv
+import json
+import logging
+import time
+
+import model
+import options
+
+log = logging.getLogger()
+
+CSV_FIELDS = ["line", "option", "latency_ms", "error"] + model.LIST_COLUMNS + ["flights", "total", "percentage"]
+
+
+def parse_date(date):
+    day, month, year = date.split("-")
+    return int(day), int(month), int(year)
+
+
+def flight_rows(results):
+    # Las consultas por año devuelven un resultado por año, se juntan en orden
+    return [dict(zip(model.LIST_COLUMNS, row)) for rows in results for row in rows]
+
+
+def percentage_row(filtered, total):
+    return {"flights": filtered, "total": total, "percentage": (filtered / total) * 100 if total else 0}
+
+
+def percentage(results):
+    filtered = sum(row[0] for row in results[0])
+    total = sum(row[0] for row in results[1])
+    return [percentage_row(filtered, total)]
+
+
+def month_counts(results):
+    # Distribucion completa, el primer renglon es el mes con mas vuelos
+    frequencies = collections.Counter(dict(results[0]))
+    return [{"month": month, "flights": flights} for month, flights in frequencies.most_common()]
+
+
+def count(dimension, value):
+    return [("SELECT_FLIGHT_COUNT", [dimension, value]), ("QUANTITY_ALL", [])]
+
+
+def by_year(name, years, params):
+    # Una sentencia por año con datos, params(year) da sus parametros
+    return [(name, params(year)) for year in years]
+
+
+def by_month(name, years, params):
+    # Una sentencia por mes de los años con datos, params(year, month) da sus parametros
+    return [(name, params(year, month)) for year in years for month in options.months]
+
+
+def plan(option, args, years):
+    # Devuelve las sentencias que hay que ejecutar y como combinar sus filas.
+    # years son los años con datos (model.known_years)
+    if option == 1:
+        return [("SELECT_ALL", [])], flight_rows
+    if option == 2:
+        return by_year("SELECT_BY_AIRLINE", years, lambda year: [args[0], year, options.months]), flight_rows
+    if option == 3:
+        wait = int(args[1])
+        return by_year("SELECT_BY_AIRLINE_WAIT", years, lambda year: [args[0], year, options.months, wait]), flight_rows
+    if option == 4:
+        wait = int(args[1])
+        if int(args[0]) == 1:
+            buckets = model.wait_buckets_upto(wait)
+            return by_month("SELECT_BY_WAIT_LESS_0", years, lambda year, month: [buckets, year, month, model.SHARDS, wait]), flight_rows
+        buckets = model.wait_buckets_from(wait)
+        return by_month("SELECT_BY_WAIT_MORE_0", years, lambda year, month: [buckets, year, month, model.SHARDS, wait]), flight_rows
+    if option == 5:
+        return [("SELECT_BY_MONTH_YEAR", [int(args[0]), int(args[1]), options.days])], flight_rows
+    if option == 6:
+        return by_year("SELECT_BY_FROM_TO", years, lambda year: [args[0], args[1], year, options.months]), flight_rows
+    if option == 7:
+        wait = int(args[2])
+        return by_year("SELECT_BY_FROM_TO_WAIT", years, lambda year: [args[0], args[1], year, options.months, wait]), flight_rows
+    if option == 8:
+        return by_year("SELECT_BY_STAY_CONNECTION", years, lambda year: [args[0], args[1], year, options.months]), flight_rows
+    if option == 9:
+        return by_year("SELECT_BY_AIRLINE_FROM", years, lambda year: [args[0], year, options.months, args[1]]), flight_rows
+    if option == 10:
+        wait = int(args[1])
+        buckets = model.wait_buckets_from(wait)
+        return by_month("SELECT_BY_TRANSIT_WAIT", years, lambda year, month: [buckets, year, month, model.SHARDS, wait, args[0]]), flight_rows
+    if option == 11:
+        return [("SELECT_BY_FROM_TO_MONTH", [args[0], args[1], years, int(args[2])])], flight_rows
+    if option == 12:
+        day, month, year = parse_date(args[0])
+        return count("date", f"{day}-{month}-{year}"), percentage
+    if option == 13:
+        return count("day", str(int(args[0]))), percentage
+    if option == 14:
+        return [("SELECT_BY_PERCENTAJE__LESS_WAIT", [int(args[0])]), ("QUANTITY_ALL", [])], percentage
+    if option == 15:
+        return [("SELECT_BY_PERCENTAJE__MORE_WAIT", [int(args[0])]), ("QUANTITY_ALL", [])], percentage
+    if option == 16:
+        return count("origin_day", f"{args[0]}:{int(args[1])}"), percentage
+    if option == 17:
+        return count("origin_month", f"{args[0]}:{int(args[1])}"), percentage
+    if option == 18:
+        return count("origin_year", f"{args[0]}:{int(args[1])}"), percentage
+    if option == 19:
+        return count("connection", "True"), percentage
+    if option == 20:
+        return count("connection", "False"), percentage
+    if option == 21:
+        day, month, year = parse_date(args[1])
+        return count("airline_date", f"{args[0]}:{day}-{month}-{year}"), percentage
+    if option == 22:
+        return [("MAIN_QUERY", [int(args[0]), args[1]])], month_counts
+    raise ValueError(f"Unknown option {option}")
+
+
+def read_spec(path):
+    with open(path, newline='') as f:
+        for number, fields in enumerate(csv.reader(f), start=1):
+            if not fields or fields[0].strip().startswith("#"):
+                continue
+            yield number, fields[0].strip(), [field.strip() for field in fields[1:]]
+
+
+def submit(session, statements, query, years):
+    number, option, args = query
+    start = time.perf_counter()
+    try:
+        option = int(option)
+        requests, combine = plan(option, args, years)
+    except (ValueError, IndexError) as error:
+        # Linea mal escrita: se reporta en su resultado y el lote sigue
+        return (number, option, args), start, [], [time.perf_counter()], error
+    futures = [session.execute_async(statements[name], params, trace=model.TRACING,
+                                     execution_profile=model.profile_for(name))
+               for name, params in requests]
+    # Hora en que llega la respuesta de cada sentencia, aunque se recoja despues
+    finished = []
+    for future in futures:
+        future.add_callbacks(lambda _: finished.append(time.perf_counter()),
+                             lambda _: finished.append(time.perf_counter()))
+    return (number, option, args), start, futures, finished, combine
+
+
+def error_result(number, option, args, start, finished, error):
+    # Latencia hasta la respuesta con error, o hasta ahora si todavia no llegaba
+    latency = ((max(finished) if finished else time.perf_counter()) - start) * 1000
+    return {"line": number, "option": option, "params": args, "latency_ms": round(latency, 3),
+            "error": f"{type(error).__name__}: {error}", "rows": []}
+
+
+def collect(submitted):
+    (number, option, args), start, futures, finished, combine = submitted
+    if isinstance(combine, Exception):
+        return error_result(number, option, args, start, finished, combine)
+    try:
+        pages = [future.result() for future in futures]
+    except Exception as error:
+        # Una consulta que falla no corta el lote, las demas siguen en vuelo
+        return error_result(number, option, args, start, finished, error)
+    paged = any(rows.has_more_pages for rows in pages)
+    results = [list(rows) for rows in pages]
+    # Si hubo mas paginas se cuenta hasta terminar de leerlas
+    end = time.perf_counter() if paged or len(finished) < len(futures) else max(finished)
+    latency = (end - start) * 1000
+    return {"line": number, "option": option, "params": args, "latency_ms": round(latency, 3), "rows": combine(results)}
+
+
+def write_result(result, fmt, out, writer=None):
+    if fmt == "jsonl":
+        out.write(json.dumps(result) + "\n")
+        return
+    for row in result["rows"] or [{}]:
+        writer.writerow(dict(row, line=result["line"], option=result["option"], latency_ms=result["latency_ms"],
+                             error=result.get("error", "")))
+
+
+def run(session, statements, spec, fmt="jsonl", out=None, concurrency=32):
+    # Se envian hasta `concurrency` consultas a la vez con execute_async
+    log.info(f"Running batch queries from {spec}")
+    writer = None
+    if fmt == "csv":
+        writer = csv.DictWriter(out, fieldnames=CSV_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+    window = collections.deque()
+    latencies = []
+    errors = 0
+    # Se leen una vez por lote, no en cada consulta
+    years = model.known_years(session, statements)
+    for query in read_spec(spec):
+        window.append(submit(session, statements, query, years))
+        if len(window) >= concurrency:
+            result = collect(window.popleft())
+            latencies.append(result["latency_ms"])
+            errors += "error" in result
+            write_result(result, fmt, out, writer)
+    while window:
+        result = collect(window.popleft())
+        latencies.append(result["latency_ms"])
+        errors += "error" in result
+        write_result(result, fmt, out, writer)
+    if latencies:
+        log.info(f"Batch finished: {len(latencies)} queries, {errors} errors, "
+                 f"mean latency {sum(latencies) / len(latencies):.1f} ms")
+    return latencies
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Benchmark de las consultas del menu.
+Genera N vuelos con flight_data.generate_dataset, los carga y repite una
+mezcla ponderada de opciones durante un tiempo fijo. El resultado (carga,
+throughput y percentiles de latencia, total y por opcion) se escribe como
+JSON para comparar corridas entre cambios de esquema o de consultas.
+
+Con --backend memory no hace falta Cassandra: las mismas sentencias de
+model.STATEMENTS se resuelven sobre listas en memoria.
+"""
+import argparse
+import collections
+import datetime
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+import batch
+import flight_data
+import loader
+import model
+
+log = logging.getLogger()
+
+CLUSTER_IPS = os.getenv('CASSANDRA_CLUSTER_IPS', 'localhost')
+# Keyspace aparte: la carga del benchmark vacia las tablas
+KEYSPACE = os.getenv('CASSANDRA_BENCH_KEYSPACE', 'investments_bench')
+REPLICATION_FACTOR = os.getenv('CASSANDRA_REPLICATION_FACTOR', '1')
+COMPRESSION = os.getenv('CASSANDRA_COMPRESSION', 'none')
+LOCAL_DC = os.getenv('CASSANDRA_LOCAL_DC')
+
+# Peso de cada opcion del menu en la mezcla por defecto
+DEFAULT_MIX = {
+    1: 1, 2: 8, 3: 4, 4: 2, 5: 8, 6: 8, 7: 4, 8: 4, 9: 6, 10: 2, 11: 10,
+    12: 6, 13: 4, 14: 3, 15: 3, 16: 4, 17: 4, 18: 4, 19: 2, 20: 2, 21: 6, 22: 8,
+}
+
+FIRST_DATE = datetime.date(2013, 1, 1)
+LAST_DATE = datetime.date(2023, 4, 25)
+
+COLUMN = {column: i for i, column in enumerate(model.FLIGHT_COLUMNS)}
+AIRLINE, DE, HACIA, DAY, MONTH, YEAR = (COLUMN[c] for c in ["airline", "de", "hacia", "day", "month", "year"])
+STAY, TRANSIT, CONNECTION, WAIT = (COLUMN[c] for c in ["stay", "transit", "connection", "wait"])
+
+# Filtro equivalente a cada sentencia de listado, p son los parametros enlazados
+FILTERS = {
+    "SELECT_ALL": lambda f, p: True,
+    "SELECT_BY_AIRLINE": lambda f, p: f[AIRLINE] == p[0] and f[YEAR] == p[1] and f[MONTH] in p[2],
+    "SELECT_BY_AIRLINE_WAIT": lambda f, p: f[AIRLINE] == p[0] and f[YEAR] == p[1] and f[MONTH] in p[2] and f[WAIT] == p[3],
+    "SELECT_BY_WAIT_LESS_0": lambda f, p: f[YEAR] == p[1] and f[MONTH] == p[2] and f[WAIT] <= p[4],
+    "SELECT_BY_WAIT_MORE_0": lambda f, p: f[YEAR] == p[1] and f[MONTH] == p[2] and f[WAIT] >= p[4],
+    "SELECT_BY_MONTH_YEAR": lambda f, p: f[MONTH] == p[0] and f[YEAR] == p[1] and f[DAY] in p[2],
+    "SELECT_BY_FROM_TO": lambda f, p: f[DE] == p[0] and f[HACIA] == p[1] and f[YEAR] == p[2] and f[MONTH] in p[3],
+    "SELECT_BY_FROM_TO_WAIT": lambda f, p: f[DE] == p[0] and f[HACIA] == p[1] and f[YEAR] == p[2] and f[MONTH] in p[3] and f[WAIT] == p[4],
+    "SELECT_BY_STAY_CONNECTION": lambda f, p: f[STAY] == p[0] and f[CONNECTION] == p[1] and f[YEAR] == p[2] and f[MONTH] in p[3],
+    "SELECT_BY_AIRLINE_FROM": lambda f, p: f[AIRLINE] == p[0] and f[YEAR] == p[1] and f[MONTH] in p[2] and f[DE] == p[3],
+    "SELECT_BY_TRANSIT_WAIT": lambda f, p: f[YEAR] == p[1] and f[MONTH] == p[2] and f[WAIT] >= p[4] and f[TRANSIT] == p[5],
+    "SELECT_BY_FROM_TO_MONTH": lambda f, p: f[DE] == p[0] and f[HACIA] == p[1] and f[YEAR] in p[2] and f[MONTH] == p[3],
+}
+
+
+class MemoryBackend(object):
+    # Sustituto en proceso de Cassandra, responde filas con la misma forma que el driver
+    name = "memory"
+
+    def __init__(self):
+        self.flights = []
+        self.counts = collections.Counter()
+        self.waits = collections.Counter()
+        self.months = collections.Counter()
+
+    def load(self, path, concurrency=None):
+        for flight in loader.read_flights(path):
+            self.flights.append(flight)
+            self.counts.update(model.counter_keys(flight))
+            self.waits[flight[WAIT]] += 1
+            self.months[model.month_key(flight)] += 1
+        return len(self.flights)
+
+    def execute(self, name, params):
+        if name in FILTERS:
+            keep = FILTERS[name]
+            return [tuple(f[COLUMN[c]] for c in model.LIST_COLUMNS) for f in self.flights if keep(f, params)]
+        if name == "QUANTITY_ALL":
+            return [(self.counts[("total", "all")],)] if self.flights else []
+        if name == "SELECT_FLIGHT_COUNT":
+            key = tuple(params)
+            return [(self.counts[key],)] if key in self.counts else []
+        if name == "SELECT_BY_PERCENTAJE__LESS_WAIT":
+            return [(n,) for wait, n in sorted(self.waits.items()) if wait <= params[0]]
+        if name == "SELECT_BY_PERCENTAJE__MORE_WAIT":
+            return [(n,) for wait, n in sorted(self.waits.items()) if wait >= params[0]]
+        if name == "MAIN_QUERY":
+            year, airline = params
+            return [(m, n) for (a, y, m), n in sorted(self.months.items()) if a == airline and y == year]
+        raise ValueError(f"Statement {name} not supported by the memory backend")
+
+    def years(self):
+        return sorted({flight[YEAR] for flight in self.flights})
+
+    def close(self):
+        pass
+
+
+class CassandraBackend(object):
+    name = "cassandra"
+
+    def __init__(self, contact_points, keyspace=KEYSPACE):
+        self.cluster = model.create_cluster(contact_points, COMPRESSION, LOCAL_DC)
+        self.session = self.cluster.connect()
+        model.create_keyspace(self.session, keyspace, REPLICATION_FACTOR)
+        self.session.set_keyspace(keyspace)
+        model.create_schema(self.session)
+        self.statements = model.prepare_statements(self.session)
+
+    def load(self, path, concurrency=64):
+        # Se parte de tablas vacias para que los contadores coincidan con el archivo
+        for table in model.FLIGHT_TABLES + ["flight_counts", "wait_counts", "airline_month_counts"]:
+            self.session.execute(f"TRUNCATE {table}", execution_profile=model.ANALYTICS_PROFILE)
+        return loader.load(self.session, self.statements, path, concurrency)
+
+    def execute(self, name, params):
+        # Directo al driver, sin pasar por model.result_cache
+        rows = model.execute_paged(self.session, self.statements[name], params,
+                                   fetch_size=model.ANALYTICS_FETCH_SIZE, profile=model.profile_for(name))
+        return list(rows)
+
+    def years(self):
+        return model.known_years(self.session, self.statements)
+
+    def close(self):
+        self.cluster.shutdown()
+
+
+def query_args(option, rng):
+    # Parametros como los escribiria un usuario en el archivo de batch.py
+    # Mismo rango de fechas que flight_data.py, con el generador del hilo para que sea reproducible
+    date = FIRST_DATE + datetime.timedelta(days=rng.randrange((LAST_DATE - FIRST_DATE).days))
+    day_month_year = f"{date.day}-{date.month}-{date.year}"
+    airline = rng.choice(flight_data.airlines)
+    origin, destination = rng.sample(flight_data.airports, 2)
+    wait = str(rng.randrange(0, 721, 30))
+    return {
+        1: [],
+        2: [airline],
+        3: [airline, wait],
+        4: [str(rng.choice([1, 2])), wait],
+        5: [str(date.month), str(date.year)],
+        6: [origin, destination],
+        7: [origin, destination, wait],
+        8: [rng.choice(flight_data.stays), str(rng.choice(flight_data.connections))],
+        9: [airline, origin],
+        10: [rng.choice(flight_data.transits), wait],
+        11: [origin, destination, str(date.month)],
+        12: [day_month_year],
+        13: [str(date.day)],
+        14: [wait],
+        15: [wait],
+        16: [origin, str(date.day)],
+        17: [origin, str(date.month)],
+        18: [origin, str(date.year)],
+        19: [],
+        20: [],
+        21: [airline, day_month_year],
+        22: [str(date.year), airline],
+    }[option]
+
+
+def percentiles(samples):
+    if not samples:
+        return {"p50_ms": 0, "p95_ms": 0, "p99_ms": 0, "max_ms": 0, "mean_ms": 0}
+    ordered = sorted(samples)
+    at = lambda fraction: ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+    return {
+        "p50_ms": round(at(0.50), 3),
+        "p95_ms": round(at(0.95), 3),
+        "p99_ms": round(at(0.99), 3),
+        "max_ms": round(ordered[-1], 3),
+        "mean_ms": round(sum(ordered) / len(ordered), 3),
+    }
+
+
+def worker(backend, mix, deadline, seed, latencies, errors, years):
+    rng = random.Random(seed)
+    options = list(mix)
+    weights = [mix[option] for option in options]
+    while time.perf_counter() < deadline:
+        option = rng.choices(options, weights)[0]
+        requests, combine = batch.plan(option, query_args(option, rng), years)
+        start = time.perf_counter()
+        try:
+            combine([backend.execute(name, params) for name, params in requests])
+        except Exception as e:
+            log.warning(f"Benchmark option {option} failed: {e}")
+            errors[option] += 1
+            continue
+        latencies[option].append((time.perf_counter() - start) * 1000)
+
+
+def run(backend, path, duration=30, threads=1, mix=None, seed=0, concurrency=64):
+    mix = mix or DEFAULT_MIX
+    start = time.perf_counter()
+    loaded = backend.load(path, concurrency)
+    load_seconds = time.perf_counter() - start
+    # Años con datos para las consultas por año, se leen una vez despues de cargar
+    years = backend.years()
+
+    latencies = collections.defaultdict(list)
+    errors = collections.Counter()
+    deadline = time.perf_counter() + duration
+    start = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(backend, mix, deadline, seed + i, latencies, errors, years))
+            for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    samples = [latency for values in latencies.values() for latency in values]
+    return {
+        "backend": backend.name,
+        "rows": loaded,
+        "seed": seed,
+        "threads": threads,
+        "duration_s": round(elapsed, 3),
+        "load": {"seconds": round(load_seconds, 3), "rows_per_s": round(loaded / load_seconds, 1) if load_seconds else 0},
+        "queries": len(samples),
+        "errors": sum(errors.values()),
+        "throughput_qps": round(len(samples) / elapsed, 2) if elapsed else 0,
+        "latency": percentiles(samples),
+        "by_option": {str(option): dict(count=len(latencies[option]), errors=errors[option], **percentiles(latencies[option]))
+                      for option in sorted(mix)},
+    }
+
+
+def compare(result, baseline, tolerance):
+    # Regresion: el p95 crece o el throughput baja mas que la tolerancia
+    regressions = []
+    if result["throughput_qps"] < baseline["throughput_qps"] * (1 - tolerance):
+        regressions.append(f"throughput {baseline['throughput_qps']} -> {result['throughput_qps']} qps")
+    for option, stats in result["by_option"].items():
+        before = baseline["by_option"].get(option)
+        if before and before["count"] and stats["count"] and stats["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"option {option} p95 {before['p95_ms']} -> {stats['p95_ms']} ms")
+    return regressions
+
+
+def parse_mix(text):
+    # "2=10,5=10,22=3"
+    return {int(option): float(weight) for option, weight in (item.split("=") for item in text.split(","))}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-r", "--rows", type=int, default=10000,
+            help="Flights generated with flight_data.py, defaults to: 10000")
+    parser.add_argument("-i", "--input",
+            help="Use this CSV instead of generating one")
+    parser.add_argument("-d", "--duration", type=float, default=30,
+            help="Seconds replaying queries, defaults to: 30")
+    parser.add_argument("-t", "--threads", type=int, default=1,
+            help="Client threads sending queries, defaults to: 1")
+    parser.add_argument("--backend", choices=["cassandra", "memory"], default="cassandra",
+            help="Where the queries run, defaults to: cassandra")
+    parser.add_argument("--mix",
+            help="Weighted options, e.g. 2=10,5=10,22=3, defaults to every menu query")
+    parser.add_argument("--seed", type=int, default=0,
+            help="Seed for the dataset and the query mix, defaults to: 0")
+    parser.add_argument("-o", "--output",
+            help="JSON report file, defaults to stdout")
+    parser.add_argument("--baseline",
+            help="Previous JSON report; exit with status 1 if this run regressed")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+            help="Allowed regression against --baseline, defaults to: 0.2")
+    args = parser.parse_args()
+
+    path = args.input
+    if path is None:
+        path = f"benchmark_{args.rows}_{args.seed}.csv"
+        random.seed(args.seed)
+        flight_data.generate_dataset(path, args.rows)
+
+    backend = MemoryBackend() if args.backend == "memory" else CassandraBackend(CLUSTER_IPS.split(','))
+    try:
+        result = run(backend, path, args.duration, args.threads, parse_mix(args.mix) if args.mix else None, args.seed)
+    finally:
+        backend.close()
+
+    report = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Cache en memoria para resultados pequeños de consultas repetidas
+(conteos, porcentajes, distribucion por mes).
+Las entradas caducan despues de `ttl` segundos y, al llenarse, se descarta
+la menos usada recientemente.
+
+Los procesos que escriben (loader.py, rebuild.py) suben una generacion
+guardada en Cassandra; el proceso que tiene el cache la revisa cada
+`check_interval` segundos y, si cambio, descarta todas las entradas.
+"""
+import collections
+import threading
+import time
+
+# Valor que regresa get() cuando la llave no esta en el cache
+MISSING = object()
+
+
+def make_key(name, params):
+    # Las listas (parametros IN) no son hashables, se convierten a tuplas
+    return name, tuple(tuple(p) if isinstance(p, list) else p for p in params or [])
+
+
+class ResultCache(object):
+
+    def __init__(self, max_size=1024, ttl=60.0, clock=time.monotonic, check_interval=2.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.check_interval = check_interval
+        self.generation = None
+        self._checked = None
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0 and self.ttl > 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            expires, value = entry
+            if self.clock() >= expires:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def generation_due(self):
+        # True cuando ya toca volver a leer la generacion de los datos
+        with self._lock:
+            now = self.clock()
+            if self._checked is not None and now - self._checked < self.check_interval:
+                return False
+            self._checked = now
+            return True
+
+    def set_generation(self, generation):
+        # Si otro proceso cambio los datos, nada de lo guardado sirve
+        with self._lock:
+            if self.generation is not None and generation != self.generation:
+                self._entries.clear()
+                self.invalidations += 1
+            self.generation = generation
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "generation": self.generation,
+            }
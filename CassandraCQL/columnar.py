@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Motor local en columnas (NumPy) con las mismas consultas que model.py.
+Carga flight_passengers.csv, o una copia binaria .npz, en un arreglo por
+columna; los textos se guardan como codigos de diccionario. Cada consulta
+es una mascara vectorizada y los conteos por mes un bincount, sin Cassandra.
+
+Las funciones select_* reciben (store, statements, ...) igual que las de
+model.py para que app.py pueda usar cualquiera de los dos con --backend.
+"""
+import argparse
+import csv
+import logging
+
+import numpy as np
+
+import model
+import options
+
+log = logging.getLogger()
+
+STRING_COLUMNS = [column for column in model.FLIGHT_COLUMNS if column not in model.INTEGER_COLUMNS]
+
+# Tipo mas chico que alcanza para cada columna numerica
+INTEGER_TYPES = {"day": np.int8, "month": np.int8, "year": np.int16, "age": np.int8, "wait": np.int16}
+
+# Filas que se convierten a arreglos por vuelta al leer el CSV
+CHUNK_SIZE = 1000000
+
+ALIASES = {"from": "de", "to": "hacia", "from__dict": "de__dict", "to__dict": "hacia__dict"}
+
+
+class Pages(object):
+    # Misma interfaz que el ResultSet del driver que usan print_pages y write_rows,
+    # las filas se decodifican por pagina
+    def __init__(self, store, index, fetch_size=model.FETCH_SIZE):
+        self.store = store
+        self.index = index
+        self.fetch_size = fetch_size
+        self.start = 0
+        self.current_rows = store.rows(index[:fetch_size])
+
+    @property
+    def has_more_pages(self):
+        return self.start + self.fetch_size < len(self.index)
+
+    def fetch_next_page(self):
+        self.start += self.fetch_size
+        self.current_rows = self.store.rows(self.index[self.start:self.start + self.fetch_size])
+
+    def __iter__(self):
+        while True:
+            yield from self.current_rows
+            if not self.has_more_pages:
+                return
+            self.fetch_next_page()
+
+
+class FlightStore(object):
+
+    def __init__(self, columns, dictionaries):
+        self.columns = columns
+        self.dictionaries = dictionaries
+        self.codes = {column: {value: code for code, value in enumerate(values)}
+                      for column, values in dictionaries.items()}
+
+    def __len__(self):
+        return len(self.columns["wait"])
+
+    @classmethod
+    def from_csv(cls, path, chunk_size=CHUNK_SIZE):
+        lookups = {column: {} for column in STRING_COLUMNS}
+        parts = {column: [] for column in model.FLIGHT_COLUMNS}
+        with open(path, newline='') as csvfile:
+            reader = csv.reader(csvfile)
+            header = next(reader)
+            position = [header.index(column) for column in model.FLIGHT_COLUMNS]
+            while True:
+                chunk = [row for _, row in zip(range(chunk_size), reader)]
+                if not chunk:
+                    break
+                for column, i in zip(model.FLIGHT_COLUMNS, position):
+                    values = [row[i] for row in chunk]
+                    if column in lookups:
+                        lookup = lookups[column]
+                        parts[column].append(np.array([lookup.setdefault(v, len(lookup)) for v in values], dtype=np.int32))
+                    else:
+                        parts[column].append(np.array(values).astype(INTEGER_TYPES[column]))
+        columns = {}
+        for column in model.FLIGHT_COLUMNS:
+            values = np.concatenate(parts[column]) if parts[column] else np.zeros(0, dtype=np.int32)
+            if column in lookups:
+                values = values.astype(np.min_scalar_type(max(len(lookups[column]) - 1, 0)))
+            columns[column] = values
+        dictionaries = {column: np.array(list(lookup), dtype=object) for column, lookup in lookups.items()}
+        log.info(f"Loaded {len(columns['wait'])} flights from {path}")
+        return cls(columns, dictionaries)
+
+    @classmethod
+    def from_npz(cls, path):
+        # Formato de flight_data.py: codigos en <columna>, valores del diccionario en <columna>__dict.
+        # Los archivos de Neo4j nombran from/to a las columnas de/hacia
+        with np.load(path, allow_pickle=False) as data:
+            stored = {ALIASES.get(name, name): name for name in data.files}
+            columns = {column: data[stored[column]] for column in model.FLIGHT_COLUMNS}
+            dictionaries = {column: data[f"{stored[column]}__dict"].astype(object) for column in STRING_COLUMNS}
+        return cls(columns, dictionaries)
+
+    @classmethod
+    def load(cls, path):
+        return cls.from_npz(path) if path.endswith(".npz") else cls.from_csv(path)
+
+    def save(self, path):
+        arrays = dict(self.columns)
+        for column, values in self.dictionaries.items():
+            arrays[f"{column}__dict"] = values.astype(str)
+        np.savez(path, **arrays)
+
+    def eq(self, column, value):
+        if column in self.codes:
+            code = self.codes[column].get(str(value))
+            if code is None:
+                return np.zeros(len(self), dtype=bool)
+            return self.columns[column] == code
+        return self.columns[column] == int(value)
+
+    def isin(self, column, values):
+        return np.isin(self.columns[column], list(values))
+
+    def flights(self, chunk_size=CHUNK_SIZE):
+        # Tuplas en el orden de FLIGHT_COLUMNS, como model.flight_from_record
+        for start in range(0, len(self), chunk_size):
+            values = []
+            for column in model.FLIGHT_COLUMNS:
+                selected = self.columns[column][start:start + chunk_size]
+                if column in self.dictionaries:
+                    selected = self.dictionaries[column][selected]
+                values.append(selected.tolist())
+            yield from zip(*values)
+
+    def rows(self, index):
+        # Tuplas en el orden de LIST_COLUMNS, como las del driver
+        values = []
+        for column in model.LIST_COLUMNS:
+            selected = self.columns[column][index]
+            if column in self.dictionaries:
+                selected = self.dictionaries[column][selected]
+            values.append(selected.tolist())
+        return list(zip(*values))
+
+
+def run_list_query(store, mask, title, render=None):
+    rows = Pages(store, np.flatnonzero(mask))
+    print(title)
+    print("\n")
+    (render or model.print_pages)(rows)
+
+
+def count(mask):
+    return int(np.count_nonzero(mask))
+
+
+def select_all(store, statements, render=None):
+    log.info("Retrieving all airport wait times")
+    run_list_query(store, np.ones(len(store), dtype=bool), f"=== All airport flight", render)
+
+def select_by_airline(store, statements, airline, render=None):
+    log.info(f"Retrieving airport wait times for airline {airline}")
+    run_list_query(store, store.eq("airline", airline), f"=== Airport wait times for airline {airline}", render)
+
+def select_by_airline_wait(store, statements, airline, wait_time, render=None):
+    log.info(f"Retrieving airport wait times for airline {airline} and wait time {wait_time}")
+    mask = store.eq("airline", airline) & store.eq("wait", wait_time)
+    run_list_query(store, mask, f"=== Airport wait times for airline {airline} and wait time {wait_time}", render)
+
+def select_by_wait_less_0(store, statements, wait_time, render=None):
+    log.info(f"Retrieving airport wait times with wait time less than or equal to {wait_time}")
+    run_list_query(store, store.columns["wait"] <= wait_time, f"=== Airport wait times with wait time less than or equal to {wait_time}", render)
+
+def select_by_wait_more_0(store, statements, wait_time, render=None):
+    log.info(f"Retrieving airport wait times with wait time greater than or equal to {wait_time}")
+    run_list_query(store, store.columns["wait"] >= wait_time, f"=== Airport wait times with wait time greater than or equal to {wait_time}", render)
+
+def select_by_month_year(store, statements, month, year, render=None):
+    log.info(f"Retrieving airport wait times for month {month} and year {year}")
+    mask = store.eq("month", month) & store.eq("year", year)
+    run_list_query(store, mask, f"=== Airport wait times for month {month} and year {year}", render)
+
+def select_by_from_to(store, statements, origin, destination, render=None):
+    log.info(f"Retrieving airport wait times for origin {origin} and destination {destination}")
+    mask = store.eq("de", origin) & store.eq("hacia", destination)
+    run_list_query(store, mask, f"=== Airport wait times for origin {origin} and destination {destination}", render)
+
+def select_by_from_to_wait(store, statements, origin, destination, wait_time, render=None):
+    log.info(f"Retrieving airport wait times for origin {origin}, destination {destination} and wait time {wait_time}")
+    mask = store.eq("de", origin) & store.eq("hacia", destination) & store.eq("wait", wait_time)
+    run_list_query(store, mask, f"=== Airport wait times for origin {origin}, destination {destination} and wait time {wait_time}", render)
+
+def select_by_stay_connection(store, statements, stay, connection, render=None):
+    log.info(f"Retrieving airport wait times for stay {stay} and connection {connection}")
+    mask = store.eq("stay", stay) & store.eq("connection", connection)
+    run_list_query(store, mask, f"=== Airport wait times for stay {stay} and connection {connection}", render)
+
+def select_by_airline_from(store, statements, airline, origin, render=None):
+    log.info(f"Retrieving airport wait times for airline {airline} and origin {origin}")
+    mask = store.eq("airline", airline) & store.eq("de", origin)
+    run_list_query(store, mask, f"=== Airport wait times for airline {airline} and origin {origin}", render)
+
+def select_by_transit_wait(store, statements, transit, wait_time, render=None):
+    log.info(f"Retrieving airport wait times for transit {transit} and wait time greater than {wait_time}")
+    mask = store.eq("transit", transit) & (store.columns["wait"] >= wait_time)
+    run_list_query(store, mask, f"=== Airport wait times for transit {transit} and wait time greater than {wait_time}", render)
+
+def select_by_from_to_month(store, statements, origin, destination, month, render=None):
+    log.info(f"Retrieving airport wait time for flights from {origin} to {destination} in {month}")
+    mask = store.eq("de", origin) & store.eq("hacia", destination) & store.eq("month", month)
+    run_list_query(store, mask, f"=== Airport wait time for flights from {origin} to {destination} in {month}", render)
+
+#Funciones especiales
+
+def select_by_percentaje_date(store, statements, day, month, year):
+    log.info(f"Retrieving percentage by date: {day}/{month}/{year}")
+    filtered_count = count(store.eq("day", day) & store.eq("month", month) & store.eq("year", year))
+    model.print_percentage(f"Percentage by date: {day}/{month}/{year}", filtered_count, len(store))
+
+def select_by_percentaje_day(store, statements, day):
+    log.info(f"Retrieving percentage by day: {day}")
+    model.print_percentage(f"Percentage by day: {day}", count(store.eq("day", day)), len(store))
+
+def select_by_percentaje_less_wait(store, statements, wait):
+    log.info(f"Retrieving percentage by wait time less or equal to {wait} minutes")
+    filtered_count = count(store.columns["wait"] <= wait)
+    model.print_percentage(f"Percentage by wait time less or equal to {wait} minutes", filtered_count, len(store))
+
+def select_by_percentaje_more_wait(store, statements, wait):
+    log.info(f"Retrieving percentage by wait time more or equal to {wait} minutes")
+    filtered_count = count(store.columns["wait"] >= wait)
+    model.print_percentage(f"Percentage by wait time more or equal to {wait} minutes", filtered_count, len(store))
+
+def select_by_percentaje_to_day(store, statements, day, airport):
+    log.info(f"Retrieving percentage by airport {airport} on day {day}")
+    filtered_count = count(store.eq("de", airport) & store.eq("day", day))
+    model.print_percentage(f"Percentage by airport {airport} on day {day}", filtered_count, len(store))
+
+def select_by_percentaje_to_month(store, statements, month, airport):
+    log.info(f"Retrieving percentage by airport {airport} on month {month}")
+    filtered_count = count(store.eq("de", airport) & store.eq("month", month))
+    model.print_percentage(f"Percentage by airport {airport} on month {month}", filtered_count, len(store))
+
+def select_by_percentaje_to_year(store, statements, year, airport):
+    log.info(f"Retrieving percentage by airport {airport} on year {year}")
+    filtered_count = count(store.eq("de", airport) & store.eq("year", year))
+    model.print_percentage(f"Percentage by airport {airport} on year {year}", filtered_count, len(store))
+
+def select_by_percentaje_connection_true(store, statements):
+    log.info("Retrieving percentage of flights with connections")
+    model.print_percentage("Percentage of flights with connections", count(store.eq("connection", "True")), len(store))
+
+def select_by_percentaje_connection_false(store, statements):
+    log.info("Retrieving percentage of flights without connections")
+    model.print_percentage("Percentage of flights without connections", count(store.eq("connection", "False")), len(store))
+
+def select_by_percentaje_airline_date(store, statements, airline, day, month, year):
+    log.info(f"Retrieving percentage of {airline} flights on {day}/{month}/{year}")
+    mask = store.eq("airline", airline) & store.eq("day", day) & store.eq("month", month) & store.eq("year", year)
+    model.print_percentage(f"Percentage of {airline} flights on {day}/{month}/{year}", count(mask), len(store))
+
+def select_by_query_main(store, statements, year_param, airline):
+    log.info(f"main query executed")
+    months = store.columns["month"][store.eq("airline", airline) & store.eq("year", year_param)]
+    flights = np.bincount(months, minlength=13)
+    model.print_month_mode(year_param, airline, {month: int(flights[month]) for month in options.months if flights[month]})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input",
+            help="CSV generated by flight_data.py, defaults to: flight_passengers.csv", default="flight_passengers.csv")
+    parser.add_argument("-o", "--output",
+            help="Binary snapshot to write, defaults to: flight_passengers.npz", default="flight_passengers.npz")
+    args = parser.parse_args()
+
+    store = FlightStore.load(args.input)
+    store.save(args.output)
+    print(f"Saved {len(store)} flights to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,103 @@
+import argparse
+import collections
 import csv
+import os
 
-# Nombre del archivo CSV
-file_name = 'flight_passengers.csv'
+import model
 
-# Lista donde se almacenarán los datos
-data_list = []
+# Tamaño del buffer de escritura
+BUFFER_SIZE = 1024 * 1024
 
-# Abrir archivo CSV y leer datos
-with open(file_name, newline='') as csvfile:
-    reader = csv.DictReader(csvfile)
-    for row in reader:
-        data_list.append(row)
+WAIT = model.FLIGHT_COLUMNS.index("wait")
 
-# Guardar los datos en un archivo de texto
-with open('tools/data.cql', 'w') as f:
-    for item in data_list:
-        print("INSERT INTO airport_wait_time (airline, de, hacia, day, month, year, age, gender, reason, stay, transit, connection, wait) VALUES ('{0}', '{1}', '{2}', {3}, {4}, {5}, {6}, '{7}', '{8}', '{9}', '{10}', '{11}', {12});".format(
-        item["airline"], item["de"], item["hacia"], int(item["day"]), int(item["month"]), int(item["year"]), int(item["age"]), item["gender"], item["reason"], item["stay"], item["transit"], item["connection"], int(item["wait"])
-    ), file=f)
+
+def cql_literal(column, value):
+    if column in model.INTEGER_COLUMNS:
+        return str(int(value))
+    # Las comillas simples se escapan duplicandolas
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def read_flights(file_name):
+    # El formato columnar (.npz) se lee completo sin parsear texto
+    if file_name.endswith(".npz"):
+        import columnar
+        yield from columnar.FlightStore.from_npz(file_name).flights()
+        return
+    # Se lee fila por fila, sin guardar el archivo completo en memoria
+    with open(file_name, newline='') as csvfile:
+        for record in csv.DictReader(csvfile):
+            yield model.flight_from_record(record)
+
+
+def write_cql(flights, output):
+    # Cada vuelo se inserta en la tabla principal y en las tablas por consulta dentro del mismo batch
+    with open(output, 'w', buffering=BUFFER_SIZE) as f:
+        for flight in flights:
+            f.write("BEGIN BATCH\n")
+            for table in model.FLIGHT_TABLES:
+                columns = model.TABLE_COLUMNS.get(table, model.FLIGHT_COLUMNS)
+                values = ", ".join(cql_literal(column, value) for column, value in zip(columns, model.table_row(table, flight)))
+                f.write(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({values});\n")
+            f.write("APPLY BATCH;\n")
+            # Contadores para los porcentajes
+            f.write("BEGIN COUNTER BATCH\n")
+            for dimension, value in model.counter_keys(flight):
+                f.write(f"UPDATE flight_counts SET flights = flights + 1 WHERE dimension = {cql_literal('dimension', dimension)} AND value = {cql_literal('value', value)};\n")
+            f.write(f"UPDATE wait_counts SET flights = flights + 1 WHERE scope = 'all' AND wait = {cql_literal('wait', flight[WAIT])};\n")
+            airline, year, month = model.month_key(flight)
+            f.write(f"UPDATE airline_month_counts SET flights = flights + 1 WHERE airline = {cql_literal('airline', airline)} AND year = {year} AND month = {month};\n")
+            f.write("APPLY BATCH;\n")
+
+
+def write_csv(flights, output):
+    # Un CSV listo para COPY FROM en cada tabla de vuelos, mas los contadores ya sumados
+    counts = collections.Counter()
+    waits = collections.Counter()
+    months = collections.Counter()
+    directory = os.path.dirname(output)
+    by_wait_columns = model.TABLE_COLUMNS["flights_by_wait_month"]
+    with open(output, 'w', newline='', buffering=BUFFER_SIZE) as f, \
+            open(os.path.join(directory, 'data_by_wait.csv'), 'w', newline='', buffering=BUFFER_SIZE) as f_wait:
+        writer = csv.writer(f)
+        writer.writerow(model.FLIGHT_COLUMNS)
+        wait_writer = csv.writer(f_wait)
+        wait_writer.writerow(by_wait_columns)
+        for flight in flights:
+            writer.writerow(flight)
+            wait_writer.writerow(model.table_row("flights_by_wait_month", flight))
+            counts.update(model.counter_keys(flight))
+            waits[flight[WAIT]] += 1
+            months[model.month_key(flight)] += 1
+
+    with open(os.path.join(directory, 'flight_counts.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["dimension", "value", "flights"])
+        for (dimension, value), flights_count in counts.items():
+            writer.writerow([dimension, value, flights_count])
+    with open(os.path.join(directory, 'wait_counts.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["scope", "wait", "flights"])
+        for wait, flights_count in sorted(waits.items()):
+            writer.writerow(["all", wait, flights_count])
+    with open(os.path.join(directory, 'airline_month_counts.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["airline", "year", "month", "flights"])
+        for (airline, year, month), flights_count in months.items():
+            writer.writerow([airline, year, month, flights_count])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input",
+            help="CSV or .npz generated by flight_data.py, defaults to: flight_passengers.csv", default="flight_passengers.csv")
+    parser.add_argument("-o", "--output",
+            help="Output file, defaults to: tools/data.cql (cql) or tools/data.csv (csv)")
+    parser.add_argument("-f", "--format", choices=["cql", "csv"],
+            help="cql writes INSERT statements for SOURCE, csv writes files for COPY FROM, defaults to: cql", default="cql")
+    args = parser.parse_args()
+
+    if args.format == "cql":
+        write_cql(read_flights(args.input), args.output or 'tools/data.cql')
+    else:
+        write_csv(read_flights(args.input), args.output or 'tools/data.csv')
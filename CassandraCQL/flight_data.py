@@ -7,9 +7,15 @@ ITESO
 import argparse
 import csv
 import datetime
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
 
 from random import choice, randint, randrange
 
+import numpy as np
+
 
 airlines = ["American Airlines", "Delta Airlines", "Alaska", "Aeromexico", "Volaris"]
 airports = ["PDX", "GDL", "SJC", "LAX", "JFK"]
@@ -19,6 +25,25 @@ stays = ["Hotel", "Short-term homestay", "Home", "Friend/Family"]
 transits = ["Airport cab", "Car rental", "Mobility as a service", "Public Transportation", "Pickup", "Own car"]
 connections = [True, False]
 
+fieldnames = ["airline", "de" ,"hacia", "day", "month", "year","age", "gender", "reason", "stay", "transit", "connection", "wait"]
+
+# Filas que genera el modo vectorizado por vuelta
+CHUNK_SIZE = 1000000
+
+# Formato columnar (.npz): cada columna de texto se guarda como codigos uint8
+# en <columna> y sus valores en <columna>__dict; fechas, edad y espera como enteros
+DICTIONARIES = {
+    "airline": airlines,
+    "de": airports,
+    "hacia": airports,
+    "gender": genders,
+    "reason": reasons,
+    "stay": stays,
+    "transit": transits + [""],
+    "connection": [str(c) for c in connections],
+}
+COLUMN_TYPES = {"day": np.int8, "month": np.int8, "year": np.int16, "age": np.int8, "wait": np.int16}
+
 
 def random_date(start_date, end_date):
     time_between_dates = end_date - start_date
@@ -30,7 +55,6 @@ def random_date(start_date, end_date):
 
 def generate_dataset(output_file, rows):
     with open(output_file, "w") as fd:
-        fieldnames = ["airline", "de" ,"hacia", "day", "month", "year","age", "gender", "reason", "stay", "transit", "connection", "wait"]
         fp_dict = csv.DictWriter(fd, fieldnames=fieldnames)
         fp_dict.writeheader()
         for i in range(rows):
@@ -71,6 +95,117 @@ def generate_dataset(output_file, rows):
             fp_dict.writerow(line)
 
 
+def generate_columns(rng, rows):
+    # Cada columna es un arreglo de codigos o enteros; las reglas de negocio se aplican con mascaras
+    from_airport = rng.integers(0, len(airports), rows)
+    # Cualquier aeropuerto distinto al origen, con la misma probabilidad
+    to_airport = (from_airport + rng.integers(1, len(airports), rows)) % len(airports)
+    start = np.datetime64("2013-01-01")
+    dates = start + rng.integers(0, (np.datetime64("2023-04-25") - start).astype(int), rows)
+    months = dates.astype("datetime64[M]")
+    reason = rng.integers(0, len(reasons), rows)
+    stay = rng.integers(0, len(stays), rows)
+    connection = rng.integers(0, len(connections), rows)
+    wait = rng.integers(30, 721, rows)
+    transit = rng.integers(0, len(transits), rows)
+    connected = np.array(connections)[connection]
+    # Sin conexion no hay espera; con conexion no hay transporte (el ultimo codigo es texto vacio)
+    wait[~connected] = 0
+    transit[connected] = len(transits)
+    back_home = reason == reasons.index("Back Home")
+    stay[back_home] = stays.index("Home")
+    connection[back_home] = connections.index(False)
+    wait[back_home] = 0
+    return {
+        "airline": rng.integers(0, len(airlines), rows),
+        "de": from_airport,
+        "hacia": to_airport,
+        "day": (dates - months).astype(int) + 1,
+        "month": months.astype(int) % 12 + 1,
+        "year": dates.astype("datetime64[Y]").astype(int) + 1970,
+        "age": rng.integers(1, 91, rows),
+        "gender": rng.integers(0, len(genders), rows),
+        "reason": reason,
+        "stay": stay,
+        "transit": transit,
+        "connection": connection,
+        "wait": wait,
+    }
+
+
+def decode_column(name, values):
+    if name in DICTIONARIES:
+        return np.array(DICTIONARIES[name], dtype=object)[values]
+    return values
+
+
+def write_columnar(output_file, chunks):
+    arrays = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in fieldnames}
+    for name, values in DICTIONARIES.items():
+        arrays[f"{name}__dict"] = np.array(values)
+    np.savez(output_file, **arrays)
+
+
+def generate_dataset_vectorized(output_file, rows, seed=None, chunk_size=CHUNK_SIZE):
+    # Mismo esquema que generate_dataset, generado por bloques; .npz escribe el formato columnar
+    rng = np.random.default_rng(seed)
+    if output_file.endswith(".npz"):
+        chunks = []
+        for start in range(0, rows, chunk_size):
+            columns = generate_columns(rng, min(chunk_size, rows - start))
+            chunks.append({name: values.astype(COLUMN_TYPES.get(name, np.uint8)) for name, values in columns.items()})
+        write_columnar(output_file, chunks)
+        return
+    with open(output_file, "w") as fd:
+        writer = csv.writer(fd)
+        writer.writerow(fieldnames)
+        for start in range(0, rows, chunk_size):
+            columns = generate_columns(rng, min(chunk_size, rows - start))
+            writer.writerows(zip(*(decode_column(name, columns[name]).tolist() for name in fieldnames)))
+
+
+def shard_path(output_file, shard):
+    # flight_passengers.csv -> flight_passengers-00000.csv
+    stem, ext = os.path.splitext(output_file)
+    return f"{stem}-{shard:05d}{ext}"
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fd:
+        for block in iter(lambda: fd.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def generate_shard(output_file, rows, seed, chunk_size):
+    generate_dataset_vectorized(output_file, rows, seed, chunk_size)
+    return {"file": os.path.basename(output_file), "rows": rows, "sha256": file_sha256(output_file)}
+
+
+def generate_sharded(output_file, rows, shards, workers=None, seed=None, chunk_size=CHUNK_SIZE):
+    # Cada shard tiene su propia semilla derivada de `seed`, asi el contenido
+    # no depende de cuantos procesos lo generan ni en que orden terminan
+    sequence = np.random.SeedSequence(seed)
+    seeds = sequence.spawn(shards)
+    sizes = [rows // shards + (1 if shard < rows % shards else 0) for shard in range(shards)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        files = list(pool.map(generate_shard, [shard_path(output_file, shard) for shard in range(shards)],
+                              sizes, seeds, [chunk_size] * shards))
+    manifest = {
+        "rows": rows,
+        "shards": shards,
+        "seed": sequence.entropy,
+        "chunk_size": chunk_size,
+        "columns": fieldnames,
+        "files": files,
+    }
+    manifest_file = os.path.splitext(output_file)[0] + ".manifest.json"
+    with open(manifest_file, "w") as fd:
+        json.dump(manifest, fd, indent=2)
+    return manifest_file
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
 
@@ -79,10 +214,28 @@ if __name__ == "__main__":
     parser.add_argument("-r", "--rows",
             help="Amount of random generated entries for the dataset, defaults to: 100", type=int, default=500)
 
+    parser.add_argument("--vectorized", action="store_true",
+            help="Generate the columns with NumPy in chunks, for millions of rows (always on for .npz output)")
+    parser.add_argument("--seed", type=int,
+            help="Random seed for --vectorized, the same seed gives the same file")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+            help="Rows generated per chunk with --vectorized, defaults to: 1000000")
+    parser.add_argument("--shards", type=int,
+            help="Split the dataset in this many files (flight_passengers-00000.csv...) plus a manifest")
+    parser.add_argument("--workers", type=int,
+            help="Processes generating shards, defaults to the number of cores")
+
     args = parser.parse_args()
     
     print(f"Generating {args.rows} for flight passenger dataset")
-    generate_dataset(args.output, args.rows)
-    print(f"Completed generating dataset in {args.output}")
+    if args.shards:
+        manifest_file = generate_sharded(args.output, args.rows, args.shards, args.workers, args.seed, args.chunk_size)
+        print(f"Completed generating {args.shards} shards, manifest in {manifest_file}")
+    else:
+        if args.vectorized or args.output.endswith(".npz"):
+            generate_dataset_vectorized(args.output, args.rows, args.seed, args.chunk_size)
+        else:
+            generate_dataset(args.output, args.rows)
+        print(f"Completed generating dataset in {args.output}")
 
 
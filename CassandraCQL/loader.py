@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Carga flight_passengers.csv directamente en Cassandra.
+Sustituye el paso extraccion.py + cqlsh SOURCE: lee el CSV por bloques,
+agrupa las filas de una misma particion en batches UNLOGGED y los ejecuta
+con concurrencia del lado del driver.
+"""
+import argparse
+import collections
+import logging
+import os
+import time
+from itertools import islice
+
+from cassandra.concurrent import execute_concurrent, execute_concurrent_with_args
+from cassandra.query import BatchStatement, BatchType
+
+import model
+from extraccion import read_flights
+
+log = logging.getLogger()
+
+CLUSTER_IPS = os.getenv('CASSANDRA_CLUSTER_IPS', 'localhost')
+KEYSPACE = os.getenv('CASSANDRA_KEYSPACE', 'investments')
+REPLICATION_FACTOR = os.getenv('CASSANDRA_REPLICATION_FACTOR', '1')
+COMPRESSION = os.getenv('CASSANDRA_COMPRESSION', 'none')
+LOCAL_DC = os.getenv('CASSANDRA_LOCAL_DC')
+PROTOCOL_VERSION = os.getenv('CASSANDRA_PROTOCOL_VERSION')
+CONNECTIONS_PER_HOST = os.getenv('CASSANDRA_CONNECTIONS_PER_HOST')
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def insert_requests(statements, flights, batch_size):
+    # Filas de la misma particion van juntas en un batch UNLOGGED,
+    # las filas sueltas se insertan como sentencias individuales
+    requests = []
+    for table in model.FLIGHT_TABLES:
+        insert = statements[f"INSERT_{table.upper()}"]
+        columns = model.TABLE_COLUMNS.get(table, model.FLIGHT_COLUMNS)
+        key = [columns.index(column) for column in model.PARTITION_KEYS[table]]
+        partitions = collections.defaultdict(list)
+        for flight in flights:
+            row = model.table_row(table, flight)
+            partitions[tuple(row[i] for i in key)].append(row)
+        for rows in partitions.values():
+            if len(rows) == 1:
+                requests.append((insert, rows[0]))
+                continue
+            for group in chunks(rows, batch_size):
+                batch = BatchStatement(batch_type=BatchType.UNLOGGED)
+                for row in group:
+                    batch.add(insert, row)
+                requests.append((batch, ()))
+    return requests
+
+
+def counter_increments(flights):
+    # Se suman los incrementos del bloque para escribir cada contador una sola vez
+    counts = collections.Counter()
+    waits = collections.Counter()
+    months = collections.Counter()
+    for flight in flights:
+        counts.update(model.counter_keys(flight))
+        waits[flight[model.FLIGHT_COLUMNS.index("wait")]] += 1
+        months[model.month_key(flight)] += 1
+    return ([(amount, dimension, value) for (dimension, value), amount in counts.items()],
+            [(amount, wait) for wait, amount in waits.items()],
+            [(amount, *key) for key, amount in months.items()])
+
+
+def load(session, statements, path, concurrency=64, chunk_size=5000, batch_size=20):
+    log.info(f"Loading {path} with concurrency {concurrency}")
+    start = time.perf_counter()
+    loaded = 0
+    for flights in chunks(read_flights(path), chunk_size):
+        execute_concurrent(session, insert_requests(statements, flights, batch_size),
+                           concurrency=concurrency, raise_on_first_error=True)
+        flight_counts, wait_counts, month_counts = counter_increments(flights)
+        execute_concurrent_with_args(session, statements['INCREMENT_FLIGHT_COUNT'], flight_counts,
+                                     concurrency=concurrency, raise_on_first_error=True)
+        execute_concurrent_with_args(session, statements['INCREMENT_WAIT_COUNT'], wait_counts,
+                                     concurrency=concurrency, raise_on_first_error=True)
+        execute_concurrent_with_args(session, statements['INCREMENT_MONTH_COUNT'], month_counts,
+                                     concurrency=concurrency, raise_on_first_error=True)
+        loaded += len(flights)
+        elapsed = time.perf_counter() - start
+        print(f"{loaded} rows loaded, {loaded / elapsed:.0f} rows/s")
+    # Los conteos en cache de app.py ya no son validos
+    model.data_changed(session, statements)
+    elapsed = time.perf_counter() - start
+    log.info(f"Loaded {loaded} rows in {elapsed:.1f}s")
+    return loaded
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input",
+            help="CSV or .npz generated by flight_data.py, defaults to: flight_passengers.csv", default="flight_passengers.csv")
+    parser.add_argument("-c", "--concurrency",
+            help="Requests in flight at the same time, defaults to: 64", type=int, default=64)
+    parser.add_argument("--chunk-size",
+            help="Rows read from the CSV per round, defaults to: 5000", type=int, default=5000)
+    parser.add_argument("--batch-size",
+            help="Maximum rows per single-partition batch, defaults to: 20", type=int, default=20)
+    args = parser.parse_args()
+
+    # Solo al ejecutarse como script, benchmark.py importa este modulo
+    log.setLevel('INFO')
+    handler = logging.FileHandler('investments.log')
+    handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s"))
+    log.addHandler(handler)
+
+    cluster = model.create_cluster(CLUSTER_IPS.split(','), COMPRESSION, LOCAL_DC, PROTOCOL_VERSION, CONNECTIONS_PER_HOST)
+    session = cluster.connect()
+    # En un cluster nuevo el keyspace todavia no existe
+    model.create_keyspace(session, KEYSPACE, REPLICATION_FACTOR)
+    session.set_keyspace(KEYSPACE)
+    model.create_schema(session)
+    statements = model.prepare_statements(session)
+
+    loaded = load(session, statements, args.input, args.concurrency, args.chunk_size, args.batch_size)
+    print(f"Completed loading {loaded} rows from {args.input}")
+    cluster.shutdown()
+
+
+if __name__ == '__main__':
+    main()
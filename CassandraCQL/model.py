@@ -1,15 +1,40 @@
 #!/usr/bin/env python3
+import importlib.util
 import logging
+import os
+import sys
 from tabulate import tabulate
 from colorama import init, Fore, Style
 init()
-import statistics
-import collections
+from cassandra import ConsistencyLevel
+from cassandra.cluster import Cluster, ExecutionProfile, EXEC_PROFILE_DEFAULT
+from cassandra.policies import DCAwareRoundRobinPolicy, HostDistance, NoSpeculativeExecutionPolicy, TokenAwarePolicy
+from cassandra.query import BatchStatement, BatchType, tuple_factory
 import options
+import cache
 
 # Set logger
 log = logging.getLogger()
 
+# Filas por pagina que pide el driver
+FETCH_SIZE = int(os.getenv('CASSANDRA_FETCH_SIZE', '100'))
+
+# Perfiles de ejecucion: lecturas puntuales (default) y recorridos largos
+OLTP_PROFILE = EXEC_PROFILE_DEFAULT
+ANALYTICS_PROFILE = 'analytics'
+OLTP_TIMEOUT = float(os.getenv('CASSANDRA_OLTP_TIMEOUT', '3'))
+ANALYTICS_TIMEOUT = float(os.getenv('CASSANDRA_ANALYTICS_TIMEOUT', '300'))
+ANALYTICS_FETCH_SIZE = int(os.getenv('CASSANDRA_ANALYTICS_FETCH_SIZE', '5000'))
+
+# CASSANDRA_TRACING=1 pide a Cassandra la traza de cada consulta (system_traces)
+TRACING = os.getenv('CASSANDRA_TRACING', '0') == '1'
+
+# Cache de resultados pequeños (conteos y meses), CASSANDRA_CACHE_TTL=0 lo desactiva
+# CASSANDRA_CACHE_CHECK_INTERVAL: cada cuantos segundos se revisa si otro proceso cambio los datos
+result_cache = cache.ResultCache(int(os.getenv('CASSANDRA_CACHE_SIZE', '1024')),
+                                 float(os.getenv('CASSANDRA_CACHE_TTL', '60')),
+                                 check_interval=float(os.getenv('CASSANDRA_CACHE_CHECK_INTERVAL', '2')))
+
 
 CREATE_KEYSPACE = """
         CREATE KEYSPACE IF NOT EXISTS {}
@@ -34,531 +59,765 @@ CREATE TABLE IF NOT EXISTS airport_wait_time (
   PRIMARY KEY ((airline, month,de, hacia, year, day), age, gender, reason, stay, transit, connection)
 ) WITH CLUSTERING ORDER BY (age DESC, gender DESC, reason DESC, stay DESC, transit DESC, connection DESC);
 '''
-CREATE_INDEXES = '''
-    CREATE INDEX IF NOT EXISTS airport_wait_time_wait_idx ON airport_wait_time (wait);
+
+# Tablas por consulta: misma fila, distinta llave de particion.
+# Todas las llaves incluyen año y mes (o dia), asi una particion solo crece con
+# los vuelos de ese periodo y no con el total de datos
+CREATE_BY_AIRLINE_MONTH_TABLE = '''
+CREATE TABLE IF NOT EXISTS flights_by_airline_month (
+  airline text,
+  de text,
+  hacia text,
+  day int,
+  month int,
+  year int,
+  age int,
+  gender text,
+  reason text,
+  stay text,
+  transit text,
+  connection text,
+  wait int,
+  PRIMARY KEY ((airline, year, month), day, de, hacia, age, gender, reason, stay, transit, connection)
+);
+'''
+
+CREATE_BY_ROUTE_MONTH_TABLE = '''
+CREATE TABLE IF NOT EXISTS flights_by_route_year_month (
+  airline text,
+  de text,
+  hacia text,
+  day int,
+  month int,
+  year int,
+  age int,
+  gender text,
+  reason text,
+  stay text,
+  transit text,
+  connection text,
+  wait int,
+  PRIMARY KEY ((de, hacia, year, month), day, airline, age, gender, reason, stay, transit, connection)
+);
+'''
+
+CREATE_BY_DATE_TABLE = '''
+CREATE TABLE IF NOT EXISTS flights_by_day (
+  airline text,
+  de text,
+  hacia text,
+  day int,
+  month int,
+  year int,
+  age int,
+  gender text,
+  reason text,
+  stay text,
+  transit text,
+  connection text,
+  wait int,
+  PRIMARY KEY ((year, month, day), airline, de, hacia, age, gender, reason, stay, transit, connection)
+);
+'''
+
+CREATE_BY_STAY_CONNECTION_TABLE = '''
+CREATE TABLE IF NOT EXISTS flights_by_stay_connection_month (
+  airline text,
+  de text,
+  hacia text,
+  day int,
+  month int,
+  year int,
+  age int,
+  gender text,
+  reason text,
+  stay text,
+  transit text,
+  connection text,
+  wait int,
+  PRIMARY KEY ((stay, connection, year, month), day, airline, de, hacia, age, gender, reason, transit)
+);
+'''
+
+# Vuelos por rango de espera, sustituye al indice secundario sobre wait.
+# Cerca de 2/3 de los vuelos (sin conexion o de regreso a casa) esperan 0 y caen
+# en la cubeta 0: la particion lleva año y mes para que no crezca con el total de
+# datos, y dentro del mes se reparte en WAIT_SHARDS por dia
+CREATE_BY_WAIT_TABLE = '''
+CREATE TABLE IF NOT EXISTS flights_by_wait_month (
+  wait_bucket int,
+  shard int,
+  airline text,
+  de text,
+  hacia text,
+  day int,
+  month int,
+  year int,
+  age int,
+  gender text,
+  reason text,
+  stay text,
+  transit text,
+  connection text,
+  wait int,
+  PRIMARY KEY ((wait_bucket, year, month, shard), wait, airline, de, hacia, day, age, gender, reason, stay, transit, connection)
+);
+'''
+
+WAIT_BUCKET_SIZE = 60
+WAIT_SHARDS = 8
+# Espera maxima que genera flight_data.py
+MAX_WAIT = 720
+SHARDS = list(range(WAIT_SHARDS))
+
+FLIGHT_COLUMNS = ["airline", "de", "hacia", "day", "month", "year", "age", "gender", "reason", "stay", "transit", "connection", "wait"]
+
+# Cada vuelo se escribe en todas estas tablas
+FLIGHT_TABLES = ["airport_wait_time", "flights_by_airline_month", "flights_by_route_year_month", "flights_by_day", "flights_by_stay_connection_month", "flights_by_wait_month"]
+
+# Columnas de cada tabla cuando no son solo FLIGHT_COLUMNS
+TABLE_COLUMNS = {
+    "flights_by_wait_month": FLIGHT_COLUMNS + ["wait_bucket", "shard"],
+}
+
+# Llave de particion de cada tabla, para agrupar escrituras de una misma particion
+PARTITION_KEYS = {
+    "airport_wait_time": ["airline", "month", "de", "hacia", "year", "day"],
+    "flights_by_airline_month": ["airline", "year", "month"],
+    "flights_by_route_year_month": ["de", "hacia", "year", "month"],
+    "flights_by_day": ["year", "month", "day"],
+    "flights_by_stay_connection_month": ["stay", "connection", "year", "month"],
+    "flights_by_wait_month": ["wait_bucket", "year", "month", "shard"],
+}
+
+INTEGER_COLUMNS = ["day", "month", "year", "age", "wait", "wait_bucket", "shard"]
+
+INSERT_FLIGHT = '''
+    INSERT INTO {} ({}) VALUES ({});
     '''
 
-CREATE_INDEXES2 = '''
-    CREATE INDEX IF NOT EXISTS year_index ON airport_wait_time (year);
+# Los indices secundarios anteriores ya no se usan
+DROP_INDEXES = '''
+    DROP INDEX IF EXISTS airport_wait_time_wait_idx;
     '''
 
-MAIN_QUERY = '''
-    SELECT airline, month
-    FROM airport_wait_time
-    WHERE year = ? AND airline = ?
-    ALLOW FILTERING;
+DROP_INDEXES2 = '''
+    DROP INDEX IF EXISTS year_index;
+    '''
+
+# Vuelos por mes de cada aerolinea y año, se mantiene en cada insercion
+CREATE_MONTH_COUNTS_TABLE = '''
+CREATE TABLE IF NOT EXISTS airline_month_counts (
+  airline text,
+  year int,
+  month int,
+  flights counter,
+  PRIMARY KEY ((airline, year), month)
+);
 '''
 
+# Generacion de los datos: la sube cada proceso que escribe, la lee el cache de app.py
+CREATE_GENERATION_TABLE = '''
+CREATE TABLE IF NOT EXISTS data_generation (
+  name text,
+  generation counter,
+  PRIMARY KEY (name)
+);
+'''
 
+INCREMENT_GENERATION = '''
+    UPDATE data_generation SET generation = generation + 1 WHERE name = 'flights';
+    '''
 
-QUANTITY_ALL = '''
-    SELECT COUNT(*) AS total_count FROM airport_wait_time;
+SELECT_GENERATION = '''
+    SELECT generation FROM data_generation WHERE name = 'flights';
+    '''
+
+INCREMENT_MONTH_COUNT = '''
+    UPDATE airline_month_counts SET flights = flights + ? WHERE airline = ? AND year = ? AND month = ?;
+    '''
+
+# Años con datos, leidos de las llaves de particion del rollup (pocas: aerolineas x años)
+SELECT_YEARS = '''
+    SELECT DISTINCT airline, year FROM airline_month_counts;
     '''
 
-SELECT_ALL = '''
-SELECT * FROM airport_wait_time;
+MAIN_QUERY = '''
+    SELECT month, flights
+    FROM airline_month_counts
+    WHERE year = ? AND airline = ?;
+'''
+
+
+
+# Columnas que muestran las consultas de listado, en el orden de HEADERS
+LIST_COLUMNS = ["airline", "de", "hacia", "day", "month", "year", "age", "reason", "wait"]
+LIST_PROJECTION = ", ".join(LIST_COLUMNS)
+
+SELECT_ALL = f'''
+SELECT {LIST_PROJECTION} FROM airport_wait_time;
+'''
+
+# Vuelo completo, para reconstruir las tablas derivadas
+SELECT_ALL_FLIGHTS = f'''
+SELECT {", ".join(FLIGHT_COLUMNS)} FROM airport_wait_time;
 '''
 
 
 
-SELECT_BY_AIRLINE = '''
-    SELECT * FROM airport_wait_time WHERE airline = ? ALLOW FILTERING;
+# Las consultas por año se ejecutan una vez por cada año con datos (known_years)
+SELECT_BY_AIRLINE = f'''
+    SELECT {LIST_PROJECTION} FROM flights_by_airline_month WHERE airline = ? AND year = ? AND month IN ?;
     '''
 
-SELECT_BY_AIRLINE_WAIT = '''
-    SELECT * FROM airport_wait_time WHERE airline = ? AND wait = ? ALLOW FILTERING;
+SELECT_BY_AIRLINE_WAIT = f'''
+    SELECT {LIST_PROJECTION} FROM flights_by_airline_month WHERE airline = ? AND year = ? AND month IN ? AND wait = ? ALLOW FILTERING;
     '''
 
-SELECT_BY_WAIT_LESS_0 = '''
-    SELECT * FROM airport_wait_time WHERE wait <= ? ALLOW FILTERING;
+# Las consultas por espera se ejecutan una vez por cada mes de los años con datos
+SELECT_BY_WAIT_LESS_0 = f'''
+    SELECT {LIST_PROJECTION} FROM flights_by_wait_month WHERE wait_bucket IN ? AND year = ? AND month = ? AND shard IN ? AND wait <= ?;
     '''
-SELECT_BY_WAIT_MORE_0 = '''
-    SELECT * FROM airport_wait_time WHERE wait >= ? ALLOW FILTERING;
+SELECT_BY_WAIT_MORE_0 = f'''
+    SELECT {LIST_PROJECTION} FROM flights_by_wait_month WHERE wait_bucket IN ? AND year = ? AND month = ? AND shard IN ? AND wait >= ?;
     '''
 
-SELECT_BY_MONTH_YEAR = '''
-    SELECT * FROM airport_wait_time WHERE month = ? AND year = ? ALLOW FILTERING;
+SELECT_BY_MONTH_YEAR = f'''
+    SELECT {LIST_PROJECTION} FROM flights_by_day WHERE month = ? AND year = ? AND day IN ?;
     '''
 
-SELECT_BY_FROM_TO = '''
-    SELECT * FROM airport_wait_time WHERE de = ? AND hacia = ?  ALLOW FILTERING;
+SELECT_BY_FROM_TO = f'''
+    SELECT {LIST_PROJECTION} FROM flights_by_route_year_month WHERE de = ? AND hacia = ? AND year = ? AND month IN ?;
     '''
 
-SELECT_BY_FROM_TO_WAIT = '''
-    SELECT * FROM airport_wait_time WHERE de = ? AND hacia = ? AND wait = ? ALLOW FILTERING;
+SELECT_BY_FROM_TO_WAIT = f'''
+    SELECT {LIST_PROJECTION} FROM flights_by_route_year_month WHERE de = ? AND hacia = ? AND year = ? AND month IN ? AND wait = ? ALLOW FILTERING;
     '''
 
-SELECT_BY_STAY_CONNECTION = '''
-    SELECT * FROM airport_wait_time WHERE stay = ? AND connection = ? ALLOW FILTERING;
+SELECT_BY_STAY_CONNECTION = f'''
+    SELECT {LIST_PROJECTION} FROM flights_by_stay_connection_month WHERE stay = ? AND connection = ? AND year = ? AND month IN ?;
     '''
 
 
-SELECT_BY_AIRLINE_FROM = '''
-    SELECT * FROM airport_wait_time WHERE airline = ? AND de = ? ALLOW FILTERING;
+SELECT_BY_AIRLINE_FROM = f'''
+    SELECT {LIST_PROJECTION} FROM flights_by_airline_month WHERE airline = ? AND year = ? AND month IN ? AND de = ? ALLOW FILTERING;
     '''
 
-SELECT_BY_TRANSIT_WAIT = '''
-    SELECT * FROM airport_wait_time WHERE transit = ? AND wait >= ? ALLOW FILTERING;
+SELECT_BY_TRANSIT_WAIT = f'''
+    SELECT {LIST_PROJECTION} FROM flights_by_wait_month WHERE wait_bucket IN ? AND year = ? AND month = ? AND shard IN ? AND wait >= ? AND transit = ? ALLOW FILTERING;
     '''
 
-SELECT_BY_FROM_TO_MONTH = '''
-    SELECT * FROM airport_wait_time WHERE de = ? AND hacia = ? AND month = ? ALLOW FILTERING;   
+SELECT_BY_FROM_TO_MONTH = f'''
+    SELECT {LIST_PROJECTION} FROM flights_by_route_year_month WHERE de = ? AND hacia = ? AND year IN ? AND month = ?;
     '''
 
 #selects especiales----------------------------------
+# Los porcentajes se leen de contadores que se actualizan en cada insercion
+
+CREATE_COUNTS_TABLE = '''
+CREATE TABLE IF NOT EXISTS flight_counts (
+  dimension text,
+  value text,
+  flights counter,
+  PRIMARY KEY ((dimension, value))
+);
+'''
 
-#UN DIA MES AÑO ESPECIFICO
-SELECT_BY_PERCENTAJE_DATE = '''
-    SELECT COUNT(*) AS filtered_count FROM airport_wait_time WHERE day = ? AND month = ? AND year = ? ALLOW FILTERING;
+CREATE_WAIT_COUNTS_TABLE = '''
+CREATE TABLE IF NOT EXISTS wait_counts (
+  scope text,
+  wait int,
+  flights counter,
+  PRIMARY KEY ((scope), wait)
+);
 '''
 
-#VUELOS EN UN DIA ESPECIFICO
-SELECT_BY_PERCENTAJE_DAY = '''
-    SELECT COUNT(*) AS filtered_count FROM airport_wait_time WHERE day = ? ALLOW FILTERING;
+INCREMENT_FLIGHT_COUNT = '''
+    UPDATE flight_counts SET flights = flights + ? WHERE dimension = ? AND value = ?;
     '''
 
-#VUELOS EN DETERMINADO TIEMPO (LEES AND MORE)
-SELECT_BY_PERCENTAJE__LESS_WAIT = '''
-    SELECT COUNT(*) AS filtered_count FROM airport_wait_time WHERE wait <= ? ALLOW FILTERING;
-    '''
-SELECT_BY_PERCENTAJE__MORE_WAIT = '''
-    SELECT COUNT(*) AS filtered_count FROM airport_wait_time WHERE wait >= ? ALLOW FILTERING;
+INCREMENT_WAIT_COUNT = '''
+    UPDATE wait_counts SET flights = flights + ? WHERE scope = 'all' AND wait = ?;
     '''
 
-#VUELOS QUE VAN A UN AEROPUERTO Y UN (DIA, MES, AÑO) ESPECIFICO
-SELECT_BY_PERCENTAJE_TO_DAY = '''
-    SELECT COUNT(*) AS filtered_count FROM airport_wait_time WHERE de = ? AND day = ? ALLOW FILTERING;
+QUANTITY_ALL = '''
+    SELECT flights AS total_count FROM flight_counts WHERE dimension = 'total' AND value = 'all';
     '''
 
-SELECT_BY_PERCENTAJE_TO_MONTH = '''
-    SELECT COUNT(*) AS filtered_count FROM airport_wait_time WHERE de = ? AND month = ? ALLOW FILTERING;
+#UN DIA MES AÑO, UN DIA, UN AEROPUERTO Y (DIA, MES, AÑO), CONEXION, AEROLINEA Y FECHA
+SELECT_FLIGHT_COUNT = '''
+    SELECT flights AS filtered_count FROM flight_counts WHERE dimension = ? AND value = ?;
     '''
 
-SELECT_BY_PERCENTAJE_TO_YEAR = '''
-    SELECT COUNT(*) AS filtered_count FROM airport_wait_time WHERE de = ? AND year = ? ALLOW FILTERING;
+#VUELOS EN DETERMINADO TIEMPO (LEES AND MORE)
+SELECT_BY_PERCENTAJE__LESS_WAIT = '''
+    SELECT flights FROM wait_counts WHERE scope = 'all' AND wait <= ?;
     '''
-
-# VUELOS POR CONEXION
-SELECT_BY_PERCENTAJE_CONNECTION_TRUE = '''
-    SELECT COUNT(*) AS filtered_count FROM airport_wait_time WHERE connection = 'True' ALLOW FILTERING;
+SELECT_BY_PERCENTAJE__MORE_WAIT = '''
+    SELECT flights FROM wait_counts WHERE scope = 'all' AND wait >= ?;
     '''
 
-SELECT_BY_PERCENTAJE_CONNECTION_FALSE = '''
-    SELECT COUNT(*) AS filtered_count FROM airport_wait_time WHERE connection = 'False' ALLOW FILTERING;
-    '''
 
-# VUELOS DE UNA AEROLINEA EN UNA FECHA ESPECIFICA
-SELECT_BY_PERCENTAJE__AIRLINE_DATE = '''
-    SELECT COUNT(*) AS filtered_count FROM airport_wait_time WHERE airline = ? AND day = ? AND month = ? AND year = ? ALLOW FILTERING;
-    '''
+def flight_from_record(record):
+    # Convierte una fila de flight_passengers.csv a una tupla en el orden de FLIGHT_COLUMNS
+    return tuple(int(record[column]) if column in INTEGER_COLUMNS else record[column] for column in FLIGHT_COLUMNS)
+
+
+def table_row(table, flight):
+    # Valores de un vuelo en el orden de las columnas de la tabla
+    if table != "flights_by_wait_month":
+        return flight
+    wait = flight[FLIGHT_COLUMNS.index("wait")]
+    day = flight[FLIGHT_COLUMNS.index("day")]
+    return tuple(flight) + (wait // WAIT_BUCKET_SIZE, day % WAIT_SHARDS)
+
+
+def wait_buckets_upto(wait):
+    return list(range(0, max(wait, -1) // WAIT_BUCKET_SIZE + 1))
+
+
+def wait_buckets_from(wait):
+    return list(range(max(wait, 0) // WAIT_BUCKET_SIZE, MAX_WAIT // WAIT_BUCKET_SIZE + 1))
+
+
+def month_key(flight):
+    # (airline, year, month) del contador de airline_month_counts
+    f = dict(zip(FLIGHT_COLUMNS, flight))
+    return f['airline'], f['year'], f['month']
+
+
+def counter_keys(flight):
+    # (dimension, value) de cada contador que incrementa un vuelo
+    f = dict(zip(FLIGHT_COLUMNS, flight))
+    date = f"{f['day']}-{f['month']}-{f['year']}"
+    return [
+        ("total", "all"),
+        ("date", date),
+        ("day", str(f['day'])),
+        ("month", str(f['month'])),
+        ("year", str(f['year'])),
+        ("origin_day", f"{f['de']}:{f['day']}"),
+        ("origin_month", f"{f['de']}:{f['month']}"),
+        ("origin_year", f"{f['de']}:{f['year']}"),
+        ("connection", str(f['connection'])),
+        ("airline_date", f"{f['airline']}:{date}"),
+    ]
+
+
+# Sentencias que usa el menu, se preparan en prepare_statements
+STATEMENTS = {
+    'INCREMENT_MONTH_COUNT': INCREMENT_MONTH_COUNT,
+    'INCREMENT_GENERATION': INCREMENT_GENERATION,
+    'SELECT_GENERATION': SELECT_GENERATION,
+    'MAIN_QUERY': MAIN_QUERY,
+    'SELECT_YEARS': SELECT_YEARS,
+    'SELECT_ALL': SELECT_ALL,
+    'SELECT_ALL_FLIGHTS': SELECT_ALL_FLIGHTS,
+    'SELECT_BY_AIRLINE': SELECT_BY_AIRLINE,
+    'SELECT_BY_AIRLINE_WAIT': SELECT_BY_AIRLINE_WAIT,
+    'SELECT_BY_WAIT_LESS_0': SELECT_BY_WAIT_LESS_0,
+    'SELECT_BY_WAIT_MORE_0': SELECT_BY_WAIT_MORE_0,
+    'SELECT_BY_MONTH_YEAR': SELECT_BY_MONTH_YEAR,
+    'SELECT_BY_FROM_TO': SELECT_BY_FROM_TO,
+    'SELECT_BY_FROM_TO_WAIT': SELECT_BY_FROM_TO_WAIT,
+    'SELECT_BY_STAY_CONNECTION': SELECT_BY_STAY_CONNECTION,
+    'SELECT_BY_AIRLINE_FROM': SELECT_BY_AIRLINE_FROM,
+    'SELECT_BY_TRANSIT_WAIT': SELECT_BY_TRANSIT_WAIT,
+    'SELECT_BY_FROM_TO_MONTH': SELECT_BY_FROM_TO_MONTH,
+    'INCREMENT_FLIGHT_COUNT': INCREMENT_FLIGHT_COUNT,
+    'INCREMENT_WAIT_COUNT': INCREMENT_WAIT_COUNT,
+    'QUANTITY_ALL': QUANTITY_ALL,
+    'SELECT_FLIGHT_COUNT': SELECT_FLIGHT_COUNT,
+    'SELECT_BY_PERCENTAJE__LESS_WAIT': SELECT_BY_PERCENTAJE__LESS_WAIT,
+    'SELECT_BY_PERCENTAJE__MORE_WAIT': SELECT_BY_PERCENTAJE__MORE_WAIT,
+}
+
+# Sentencias que leen muchas particiones; el resto usa el perfil OLTP
+STATEMENT_PROFILES = {
+    "SELECT_ALL": ANALYTICS_PROFILE,
+    "SELECT_ALL_FLIGHTS": ANALYTICS_PROFILE,
+    "SELECT_YEARS": ANALYTICS_PROFILE,
+    "SELECT_BY_WAIT_LESS_0": ANALYTICS_PROFILE,
+    "SELECT_BY_WAIT_MORE_0": ANALYTICS_PROFILE,
+    "SELECT_BY_TRANSIT_WAIT": ANALYTICS_PROFILE,
+}
+
+
+def profile_for(name):
+    return STATEMENT_PROFILES.get(name, OLTP_PROFILE)
+
+
+def oltp_profile(local_dc=None, row_factory=tuple_factory):
+    # Token-aware: la consulta va directo a una replica de la particion
+    return ExecutionProfile(load_balancing_policy=TokenAwarePolicy(DCAwareRoundRobinPolicy(local_dc)),
+                            consistency_level=ConsistencyLevel.LOCAL_ONE,
+                            request_timeout=OLTP_TIMEOUT,
+                            row_factory=row_factory)
+
+
+def analytics_profile(local_dc=None, row_factory=tuple_factory):
+    # Sin ejecucion especulativa: duplicar un recorrido largo solo agrega carga
+    return ExecutionProfile(load_balancing_policy=DCAwareRoundRobinPolicy(local_dc),
+                            consistency_level=ConsistencyLevel.LOCAL_ONE,
+                            request_timeout=ANALYTICS_TIMEOUT,
+                            speculative_execution_policy=NoSpeculativeExecutionPolicy(),
+                            row_factory=row_factory)
+
+
+def compression_option(value):
+    # none, lz4, snappy o true (el driver elige la que tenga instalada)
+    return {"": False, "none": False, "false": False, "true": True}.get(str(value).lower(), value)
+
+
+def create_cluster(contact_points, compression="none", local_dc=None, protocol_version=None, connections_per_host=None,
+                   metrics_enabled=False):
+    kwargs = {"protocol_version": int(protocol_version)} if protocol_version else {}
+    # Las metricas del driver dependen del paquete opcional scales
+    if metrics_enabled and importlib.util.find_spec("greplin") is None:
+        log.warning("Driver metrics disabled, install the scales package to enable them")
+        metrics_enabled = False
+    cluster = Cluster(contact_points,
+                      execution_profiles={OLTP_PROFILE: oltp_profile(local_dc),
+                                          ANALYTICS_PROFILE: analytics_profile(local_dc)},
+                      compression=compression_option(compression),
+                      metrics_enabled=metrics_enabled,
+                      **kwargs)
+    if connections_per_host:
+        # El driver solo abre varias conexiones por host con protocolo v1/v2
+        if cluster.protocol_version < 3:
+            cluster.set_max_connections_per_host(HostDistance.LOCAL, int(connections_per_host))
+            cluster.set_core_connections_per_host(HostDistance.LOCAL, int(connections_per_host))
+        else:
+            log.warning("CASSANDRA_CONNECTIONS_PER_HOST ignored, protocol v3+ uses one connection per host")
+    return cluster
 
 
 def create_keyspace(session, keyspace, replication_factor):
     log.info(f"Creating keyspace: {keyspace} with replication factor {replication_factor}")
-    session.execute(CREATE_KEYSPACE.format(keyspace, replication_factor))
+    session.execute(CREATE_KEYSPACE.format(keyspace, replication_factor), execution_profile=ANALYTICS_PROFILE)
 
 
 def create_schema(session):
     log.info("Creating model schema")
-    session.execute(CREATE_PRINCIPAL_TABLE)
-    session.execute(CREATE_INDEXES)
-
-
-def select_all(session):
-    log.info("Retrieving all airport wait times")
-    stmt = session.prepare(SELECT_ALL)
-    rows = session.execute(stmt)
-    print(f"=== All airport flight")
+    # DDL con el timeout largo, crear tablas puede tardar mas que una lectura
+    for query in [CREATE_PRINCIPAL_TABLE, CREATE_BY_AIRLINE_MONTH_TABLE, CREATE_BY_ROUTE_MONTH_TABLE,
+                  CREATE_BY_DATE_TABLE, CREATE_BY_STAY_CONNECTION_TABLE, CREATE_BY_WAIT_TABLE,
+                  CREATE_COUNTS_TABLE, CREATE_WAIT_COUNTS_TABLE, CREATE_MONTH_COUNTS_TABLE, CREATE_GENERATION_TABLE,
+                  DROP_INDEXES, DROP_INDEXES2]:
+        session.execute(query, execution_profile=ANALYTICS_PROFILE)
+
+
+def prepare_statements(session):
+    # Se prepara cada sentencia una sola vez por sesion
+    log.info("Preparing statements")
+    statements = {name: session.prepare(query) for name, query in STATEMENTS.items()}
+    for table in FLIGHT_TABLES:
+        columns = TABLE_COLUMNS.get(table, FLIGHT_COLUMNS)
+        query = INSERT_FLIGHT.format(table, ", ".join(columns), ", ".join("?" for _ in columns))
+        statements[f"INSERT_{table.upper()}"] = session.prepare(query)
+    return statements
+
+
+def count_flight(session, statements, flight):
+    # Los contadores no pueden ir en el mismo batch que las inserciones
+    batch = BatchStatement(batch_type=BatchType.COUNTER)
+    for dimension, value in counter_keys(flight):
+        batch.add(statements['INCREMENT_FLIGHT_COUNT'], [1, dimension, value])
+    batch.add(statements['INCREMENT_WAIT_COUNT'], [1, flight[FLIGHT_COLUMNS.index("wait")]])
+    batch.add(statements['INCREMENT_MONTH_COUNT'], [1, *month_key(flight)])
+    session.execute(batch)
+
+
+def rebuild_query_tables(session, statements):
+    log.info("Rebuilding query tables from airport_wait_time")
+    # Los contadores no son idempotentes, se recalculan desde cero
+    for table in ["flight_counts", "wait_counts", "airline_month_counts"]:
+        session.execute(f"TRUNCATE {table}", execution_profile=ANALYTICS_PROFILE)
+    count = 0
+    for flight in execute_paged(session, statements['SELECT_ALL_FLIGHTS'], fetch_size=ANALYTICS_FETCH_SIZE,
+                                profile=ANALYTICS_PROFILE):
+        for table in FLIGHT_TABLES[1:]:
+            session.execute(statements[f"INSERT_{table.upper()}"], table_row(table, flight))
+        count_flight(session, statements, flight)
+        count += 1
+    data_changed(session, statements)
+    log.info(f"Rebuilt query tables with {count} flights")
+    return count
+
+
+HEADERS = ["Airline", "From", "To", "Day", "Month", "Year", "Age", "Reason", "Wait"]
+
+
+def execute_paged(session, stmt, params=None, fetch_size=None, profile=OLTP_PROFILE):
+    bound = stmt.bind(params or [])
+    bound.fetch_size = fetch_size or FETCH_SIZE
+    return session.execute(bound, trace=TRACING, execution_profile=profile)
+
+
+class ChainedPages(object):
+    # Varias consultas (una por año o por mes) ejecutadas una tras otra, con la misma
+    # interfaz de ResultSet que usan print_pages y write_rows. La siguiente consulta
+    # solo se ejecuta cuando se termina de leer la anterior
+    def __init__(self, session, stmt, param_sets, fetch_size=None, profile=OLTP_PROFILE):
+        self.session = session
+        self.stmt = stmt
+        self.fetch_size = fetch_size
+        self.profile = profile
+        self._pending = iter(param_sets)
+        self._next = None
+        self._rows = self._next_result()
+        self._next = None
+        self.current_rows = self._rows.current_rows if self._rows is not None else []
+
+    def _next_result(self):
+        # Las consultas sin filas (periodos sin vuelos) se saltan
+        if self._next is None:
+            for params in self._pending:
+                rows = execute_paged(self.session, self.stmt, params, self.fetch_size, self.profile)
+                if rows.current_rows or rows.has_more_pages:
+                    self._next = rows
+                    break
+        return self._next
+
+    @property
+    def has_more_pages(self):
+        return self._rows is not None and (self._rows.has_more_pages or self._next_result() is not None)
+
+    def fetch_next_page(self):
+        if self._rows.has_more_pages:
+            self._rows.fetch_next_page()
+        else:
+            self._rows, self._next = self._next_result(), None
+        self.current_rows = self._rows.current_rows
+
+    def __iter__(self):
+        while True:
+            yield from self.current_rows
+            if not self.has_more_pages:
+                return
+            self.fetch_next_page()
+
+
+def known_years(session, statements):
+    # Años que aparecen en los datos, en lugar de un rango fijo
+    return sorted({year for _, year in fetch_rows(session, statements, 'SELECT_YEARS')})
+
+
+def known_months(session, statements):
+    # (año, mes) de cada mes de los años con datos
+    return [(year, month) for year in known_years(session, statements) for month in options.months]
+
+
+def run_list_query(session, statements, name, param_sets, title, render=None):
+    # Motor comun de las consultas de listado: las filas llegan como tuplas
+    # en el orden de LIST_COLUMNS y solo se formatean al mostrarse
+    rows = ChainedPages(session, statements[name], param_sets, profile=profile_for(name))
+    print(title)
     print("\n")
-
-    data = []
+    (render or print_pages)(rows)
+
+
+def format_row(row):
+    airline, de, hacia, day, month, year, age, reason, wait = row
+    return [f"{Style.BRIGHT}{Fore.GREEN}{airline}{Style.RESET_ALL}", de, hacia,
+            f"{Style.BRIGHT}{Fore.BLUE}{day}{Style.RESET_ALL}",
+            f"{Style.BRIGHT}{Fore.BLUE}{month}{Style.RESET_ALL}",
+            f"{Style.BRIGHT}{Fore.BLUE}{year}{Style.RESET_ALL}",
+            age, reason,
+            f"{Style.BRIGHT}{Fore.RED}{wait}{Style.RESET_ALL}"]
+
+
+def print_pages(rows, next_page=None):
+    # Una tabla por pagina del driver, solo se guarda en memoria la pagina actual
+    while True:
+        data = [format_row(row) for row in rows.current_rows]
+        print(tabulate(data, headers=HEADERS, tablefmt="fancy_grid"))
+        if not rows.has_more_pages:
+            break
+        if next_page is not None and not next_page():
+            break
+        rows.fetch_next_page()
+
+
+def write_rows(rows, out=sys.stdout):
+    # Texto plano separado por tabuladores, las paginas se piden conforme se recorren las filas
+    out.write("\t".join(HEADERS) + "\n")
     for row in rows:
-        airline = f"{Style.BRIGHT}{Fore.GREEN}{row.airline}{Style.RESET_ALL}"
-        day = f"{Style.BRIGHT}{Fore.BLUE}{row.day}{Style.RESET_ALL}"
-        month = f"{Style.BRIGHT}{Fore.BLUE}{row.month}{Style.RESET_ALL}"
-        year = f"{Style.BRIGHT}{Fore.BLUE}{row.year}{Style.RESET_ALL}"
-        wait = f"{Style.BRIGHT}{Fore.RED}{row.wait}{Style.RESET_ALL}"
+        out.write("\t".join(map(str, row)) + "\n")
 
-        data.append([airline, row.de, row.hacia, day, month, year, row.age, row.reason, wait])
 
-    headers = ["Airline", "From", "To", "Day", "Month", "Year", "Age", "Reason", "Wait"]
-    print(tabulate(data, headers=headers, tablefmt="fancy_grid"))
+def select_all(session, statements, render=None):
+    log.info("Retrieving all airport wait times")
+    run_list_query(session, statements, 'SELECT_ALL', [None], f"=== All airport flight", render)
 
-def select_by_airline(session, airline):
+def select_by_airline(session, statements, airline, render=None):
     log.info(f"Retrieving airport wait times for airline {airline}")
-    stmt = session.prepare(SELECT_BY_AIRLINE)
-    rows = session.execute(stmt, [airline])
-    print(f"=== Airport wait times for airline {airline}")
-    print("\n")
-    data = []
-    for row in rows:
-        airline = f"{Style.BRIGHT}{Fore.GREEN}{row.airline}{Style.RESET_ALL}"
-        day = f"{Style.BRIGHT}{Fore.BLUE}{row.day}{Style.RESET_ALL}"
-        month = f"{Style.BRIGHT}{Fore.BLUE}{row.month}{Style.RESET_ALL}"
-        year = f"{Style.BRIGHT}{Fore.BLUE}{row.year}{Style.RESET_ALL}"
-        wait = f"{Style.BRIGHT}{Fore.RED}{row.wait}{Style.RESET_ALL}"
-
-        data.append([airline, row.de, row.hacia, day, month, year, row.age, row.reason, wait])
-
-    headers = ["Airline", "From", "To", "Day", "Month", "Year", "Age", "Reason", "Wait"]
-    print(tabulate(data, headers=headers, tablefmt="fancy_grid"))
+    run_list_query(session, statements, 'SELECT_BY_AIRLINE', [[airline, year, options.months] for year in known_years(session, statements)], f"=== Airport wait times for airline {airline}", render)
 
-def select_by_airline_wait(session, airline, wait_time):
+def select_by_airline_wait(session, statements, airline, wait_time, render=None):
     log.info(f"Retrieving airport wait times for airline {airline} and wait time {wait_time}")
-    stmt = session.prepare(SELECT_BY_AIRLINE_WAIT)
-    rows = session.execute(stmt, [airline, wait_time])
-    print(f"=== Airport wait times for airline {airline} and wait time {wait_time}")
-    print("\n")
-    data = []
-    for row in rows:
-        airline = f"{Style.BRIGHT}{Fore.GREEN}{row.airline}{Style.RESET_ALL}"
-        day = f"{Style.BRIGHT}{Fore.BLUE}{row.day}{Style.RESET_ALL}"
-        month = f"{Style.BRIGHT}{Fore.BLUE}{row.month}{Style.RESET_ALL}"
-        year = f"{Style.BRIGHT}{Fore.BLUE}{row.year}{Style.RESET_ALL}"
-        wait = f"{Style.BRIGHT}{Fore.RED}{row.wait}{Style.RESET_ALL}"
-
-        data.append([airline, row.de, row.hacia, day, month, year, row.age, row.reason, wait])
+    run_list_query(session, statements, 'SELECT_BY_AIRLINE_WAIT', [[airline, year, options.months, wait_time] for year in known_years(session, statements)], f"=== Airport wait times for airline {airline} and wait time {wait_time}", render)
 
-    headers = ["Airline", "From", "To", "Day", "Month", "Year", "Age", "Reason", "Wait"]
-    print(tabulate(data, headers=headers, tablefmt="fancy_grid"))
-
-def select_by_wait_less_0(session, wait_time):
+def select_by_wait_less_0(session, statements, wait_time, render=None):
     log.info(f"Retrieving airport wait times with wait time less than or equal to {wait_time}")
-    stmt = session.prepare(SELECT_BY_WAIT_LESS_0)
-    rows = session.execute(stmt, [wait_time])
-    print(f"=== Airport wait times with wait time less than or equal to {wait_time}")
-    print("\n")
-    data = []
-    for row in rows:
-        airline = f"{Style.BRIGHT}{Fore.GREEN}{row.airline}{Style.RESET_ALL}"
-        day = f"{Style.BRIGHT}{Fore.BLUE}{row.day}{Style.RESET_ALL}"
-        month = f"{Style.BRIGHT}{Fore.BLUE}{row.month}{Style.RESET_ALL}"
-        year = f"{Style.BRIGHT}{Fore.BLUE}{row.year}{Style.RESET_ALL}"
-        wait = f"{Style.BRIGHT}{Fore.RED}{row.wait}{Style.RESET_ALL}"
-
-        data.append([airline, row.de, row.hacia, day, month, year, row.age, row.reason, wait])
+    run_list_query(session, statements, 'SELECT_BY_WAIT_LESS_0', [[wait_buckets_upto(wait_time), year, month, SHARDS, wait_time] for year, month in known_months(session, statements)], f"=== Airport wait times with wait time less than or equal to {wait_time}", render)
 
-    headers = ["Airline", "From", "To", "Day", "Month", "Year", "Age", "Reason", "Wait"]
-    print(tabulate(data, headers=headers, tablefmt="fancy_grid"))
-
-def select_by_wait_more_0(session, wait_time):
+def select_by_wait_more_0(session, statements, wait_time, render=None):
     log.info(f"Retrieving airport wait times with wait time greater than or equal to {wait_time}")
-    stmt = session.prepare(SELECT_BY_WAIT_MORE_0)
-    rows = session.execute(stmt, [wait_time])
-    print(f"=== Airport wait times with wait time greater than or equal to {wait_time}")
-    print("\n")
-    data = []
-    for row in rows:
-        airline = f"{Style.BRIGHT}{Fore.GREEN}{row.airline}{Style.RESET_ALL}"
-        day = f"{Style.BRIGHT}{Fore.BLUE}{row.day}{Style.RESET_ALL}"
-        month = f"{Style.BRIGHT}{Fore.BLUE}{row.month}{Style.RESET_ALL}"
-        year = f"{Style.BRIGHT}{Fore.BLUE}{row.year}{Style.RESET_ALL}"
-        wait = f"{Style.BRIGHT}{Fore.RED}{row.wait}{Style.RESET_ALL}"
+    run_list_query(session, statements, 'SELECT_BY_WAIT_MORE_0', [[wait_buckets_from(wait_time), year, month, SHARDS, wait_time] for year, month in known_months(session, statements)], f"=== Airport wait times with wait time greater than or equal to {wait_time}", render)
 
-        data.append([airline, row.de, row.hacia, day, month, year, row.age, row.reason, wait])
-
-    headers = ["Airline", "From", "To", "Day", "Month", "Year", "Age", "Reason", "Wait"]
-    print(tabulate(data, headers=headers, tablefmt="fancy_grid"))
-
-def select_by_month_year(session, month, year):
+def select_by_month_year(session, statements, month, year, render=None):
     log.info(f"Retrieving airport wait times for month {month} and year {year}")
-    stmt = session.prepare(SELECT_BY_MONTH_YEAR)
-    rows = session.execute(stmt, [month, year])
-    print(f"=== Airport wait times for month {month} and year {year}")
-    print("\n")
-    data = []
-    for row in rows:
-        airline = f"{Style.BRIGHT}{Fore.GREEN}{row.airline}{Style.RESET_ALL}"
-        day = f"{Style.BRIGHT}{Fore.BLUE}{row.day}{Style.RESET_ALL}"
-        month = f"{Style.BRIGHT}{Fore.BLUE}{row.month}{Style.RESET_ALL}"
-        year = f"{Style.BRIGHT}{Fore.BLUE}{row.year}{Style.RESET_ALL}"
-        wait = f"{Style.BRIGHT}{Fore.RED}{row.wait}{Style.RESET_ALL}"
-
-        data.append([airline, row.de, row.hacia, day, month, year, row.age, row.reason, wait])
-
-    headers = ["Airline", "From", "To", "Day", "Month", "Year", "Age", "Reason", "Wait"]
-    print(tabulate(data, headers=headers, tablefmt="fancy_grid"))
+    run_list_query(session, statements, 'SELECT_BY_MONTH_YEAR', [[month, year, options.days]], f"=== Airport wait times for month {month} and year {year}", render)
 
-def select_by_from_to(session, origin, destination):
+def select_by_from_to(session, statements, origin, destination, render=None):
     log.info(f"Retrieving airport wait times for origin {origin} and destination {destination}")
-    stmt = session.prepare(SELECT_BY_FROM_TO)
-    rows = session.execute(stmt, [origin, destination])
-    print(f"=== Airport wait times for origin {origin} and destination {destination}")
-    print("\n")
-    data = []
-    for row in rows:
-        airline = f"{Style.BRIGHT}{Fore.GREEN}{row.airline}{Style.RESET_ALL}"
-        day = f"{Style.BRIGHT}{Fore.BLUE}{row.day}{Style.RESET_ALL}"
-        month = f"{Style.BRIGHT}{Fore.BLUE}{row.month}{Style.RESET_ALL}"
-        year = f"{Style.BRIGHT}{Fore.BLUE}{row.year}{Style.RESET_ALL}"
-        wait = f"{Style.BRIGHT}{Fore.RED}{row.wait}{Style.RESET_ALL}"
-
-        data.append([airline, row.de, row.hacia, day, month, year, row.age, row.reason, wait])
-
-    headers = ["Airline", "From", "To", "Day", "Month", "Year", "Age", "Reason", "Wait"]
-    print(tabulate(data, headers=headers, tablefmt="fancy_grid"))
+    run_list_query(session, statements, 'SELECT_BY_FROM_TO', [[origin, destination, year, options.months] for year in known_years(session, statements)], f"=== Airport wait times for origin {origin} and destination {destination}", render)
 
-def select_by_from_to_wait(session, origin, destination, wait_time):
+def select_by_from_to_wait(session, statements, origin, destination, wait_time, render=None):
     log.info(f"Retrieving airport wait times for origin {origin}, destination {destination} and wait time {wait_time}")
-    stmt = session.prepare(SELECT_BY_FROM_TO_WAIT)
-    rows = session.execute(stmt, [origin, destination, wait_time])
-    print(f"=== Airport wait times for origin {origin}, destination {destination} and wait time {wait_time}")
-    print("\n")
-    data = []
-    for row in rows:
-        airline = f"{Style.BRIGHT}{Fore.GREEN}{row.airline}{Style.RESET_ALL}"
-        day = f"{Style.BRIGHT}{Fore.BLUE}{row.day}{Style.RESET_ALL}"
-        month = f"{Style.BRIGHT}{Fore.BLUE}{row.month}{Style.RESET_ALL}"
-        year = f"{Style.BRIGHT}{Fore.BLUE}{row.year}{Style.RESET_ALL}"
-        wait = f"{Style.BRIGHT}{Fore.RED}{row.wait}{Style.RESET_ALL}"
-
-        data.append([airline, row.de, row.hacia, day, month, year, row.age, row.reason, wait])
+    run_list_query(session, statements, 'SELECT_BY_FROM_TO_WAIT', [[origin, destination, year, options.months, wait_time] for year in known_years(session, statements)], f"=== Airport wait times for origin {origin}, destination {destination} and wait time {wait_time}", render)
 
-    headers = ["Airline", "From", "To", "Day", "Month", "Year", "Age", "Reason", "Wait"]
-    print(tabulate(data, headers=headers, tablefmt="fancy_grid"))
-
-def select_by_stay_connection(session, stay, connection):
+def select_by_stay_connection(session, statements, stay, connection, render=None):
     log.info(f"Retrieving airport wait times for stay {stay} and connection {connection}")
-    stmt = session.prepare(SELECT_BY_STAY_CONNECTION)
-    rows = session.execute(stmt, [stay, connection])
-    print(f"=== Airport wait times for stay {stay} and connection {connection}")
-    print("\n")
-    data = []
-    for row in rows:
-        airline = f"{Style.BRIGHT}{Fore.GREEN}{row.airline}{Style.RESET_ALL}"
-        day = f"{Style.BRIGHT}{Fore.BLUE}{row.day}{Style.RESET_ALL}"
-        month = f"{Style.BRIGHT}{Fore.BLUE}{row.month}{Style.RESET_ALL}"
-        year = f"{Style.BRIGHT}{Fore.BLUE}{row.year}{Style.RESET_ALL}"
-        wait = f"{Style.BRIGHT}{Fore.RED}{row.wait}{Style.RESET_ALL}"
+    run_list_query(session, statements, 'SELECT_BY_STAY_CONNECTION', [[stay, connection, year, options.months] for year in known_years(session, statements)], f"=== Airport wait times for stay {stay} and connection {connection}", render)
 
-        data.append([airline, row.de, row.hacia, day, month, year, row.age, row.reason, wait])
-
-    headers = ["Airline", "From", "To", "Day", "Month", "Year", "Age", "Reason", "Wait"]
-    print(tabulate(data, headers=headers, tablefmt="fancy_grid"))
-
-def select_by_airline_from(session, airline, origin):
+def select_by_airline_from(session, statements, airline, origin, render=None):
     log.info(f"Retrieving airport wait times for airline {airline} and origin {origin}")
-    stmt = session.prepare(SELECT_BY_AIRLINE_FROM)
-    rows = session.execute(stmt, [airline, origin])
-    print(f"=== Airport wait times for airline {airline} and origin {origin}")
-    print("\n")
-    data = []
-    for row in rows:
-        airline = f"{Style.BRIGHT}{Fore.GREEN}{row.airline}{Style.RESET_ALL}"
-        day = f"{Style.BRIGHT}{Fore.BLUE}{row.day}{Style.RESET_ALL}"
-        month = f"{Style.BRIGHT}{Fore.BLUE}{row.month}{Style.RESET_ALL}"
-        year = f"{Style.BRIGHT}{Fore.BLUE}{row.year}{Style.RESET_ALL}"
-        wait = f"{Style.BRIGHT}{Fore.RED}{row.wait}{Style.RESET_ALL}"
-
-        data.append([airline, row.de, row.hacia, day, month, year, row.age, row.reason, wait])
+    run_list_query(session, statements, 'SELECT_BY_AIRLINE_FROM', [[airline, year, options.months, origin] for year in known_years(session, statements)], f"=== Airport wait times for airline {airline} and origin {origin}", render)
 
-    headers = ["Airline", "From", "To", "Day", "Month", "Year", "Age", "Reason", "Wait"]
-    print(tabulate(data, headers=headers, tablefmt="fancy_grid"))
-
-def select_by_transit_wait(session, transit, wait_time):
+def select_by_transit_wait(session, statements, transit, wait_time, render=None):
     log.info(f"Retrieving airport wait times for transit {transit} and wait time greater than {wait_time}")
-    stmt = session.prepare(SELECT_BY_TRANSIT_WAIT)
-    rows = session.execute(stmt, [transit, wait_time])
-    print(f"=== Airport wait times for transit {transit} and wait time greater than {wait_time}")
-    print("\n")
-    data = []
-    for row in rows:
-        airline = f"{Style.BRIGHT}{Fore.GREEN}{row.airline}{Style.RESET_ALL}"
-        day = f"{Style.BRIGHT}{Fore.BLUE}{row.day}{Style.RESET_ALL}"
-        month = f"{Style.BRIGHT}{Fore.BLUE}{row.month}{Style.RESET_ALL}"
-        year = f"{Style.BRIGHT}{Fore.BLUE}{row.year}{Style.RESET_ALL}"
-        wait = f"{Style.BRIGHT}{Fore.RED}{row.wait}{Style.RESET_ALL}"
-
-        data.append([airline, row.de, row.hacia, day, month, year, row.age, row.reason, wait])
-
-    headers = ["Airline", "From", "To", "Day", "Month", "Year", "Age", "Reason", "Wait"]
-    print(tabulate(data, headers=headers, tablefmt="fancy_grid"))
+    run_list_query(session, statements, 'SELECT_BY_TRANSIT_WAIT', [[wait_buckets_from(wait_time), year, month, SHARDS, wait_time, transit] for year, month in known_months(session, statements)], f"=== Airport wait times for transit {transit} and wait time greater than {wait_time}", render)
 
-def select_by_from_to_month(session, origin, destination, month):
+def select_by_from_to_month(session, statements, origin, destination, month, render=None):
     log.info(f"Retrieving airport wait time for flights from {origin} to {destination} in {month}")
-    stmt = session.prepare(SELECT_BY_FROM_TO_MONTH)
-    rows = session.execute(stmt, [origin, destination, month])
-    print(f"=== Airport wait time for flights from {origin} to {destination} in {month}")
-    print("\n")
-    data = []
-    for row in rows:
-        airline = f"{Style.BRIGHT}{Fore.GREEN}{row.airline}{Style.RESET_ALL}"
-        day = f"{Style.BRIGHT}{Fore.BLUE}{row.day}{Style.RESET_ALL}"
-        month = f"{Style.BRIGHT}{Fore.BLUE}{row.month}{Style.RESET_ALL}"
-        year = f"{Style.BRIGHT}{Fore.BLUE}{row.year}{Style.RESET_ALL}"
-        wait = f"{Style.BRIGHT}{Fore.RED}{row.wait}{Style.RESET_ALL}"
-
-        data.append([airline, row.de, row.hacia, day, month, year, row.age, row.reason, wait])
-
-    headers = ["Airline", "From", "To", "Day", "Month", "Year", "Age", "Reason", "Wait"]
-    print(tabulate(data, headers=headers, tablefmt="fancy_grid"))
+    run_list_query(session, statements, 'SELECT_BY_FROM_TO_MONTH', [[origin, destination, known_years(session, statements), month]], f"=== Airport wait time for flights from {origin} to {destination} in {month}", render)
 
 #Funciones especiales
 flights_formatted = f"{Style.BRIGHT}{Fore.YELLOW}Flights{Style.RESET_ALL}"
 percentage_formatted = f"{Style.BRIGHT}{Fore.YELLOW}Percentage{Style.RESET_ALL}"
 
-def select_by_percentaje_date(session, day, month, year):
-    log.info(f"Retrieving percentage by date: {day}/{month}/{year}")
-    total_f = session.prepare(QUANTITY_ALL)
-    stmt = session.prepare(SELECT_BY_PERCENTAJE_DATE)
-    total_r = session.execute(total_f)
-    rows = session.execute(stmt, [day, month, year])
-    filtered_count = rows.one().filtered_count
-    total_count = total_r.one().total_count
-    percentage = (filtered_count / total_count) * 100
-    print(f"Percentage by date: {day}/{month}/{year}")
+def data_changed(session, statements):
+    # Lo llama quien escribe: limpia su propio cache y avisa a los demas procesos
+    session.execute(statements['INCREMENT_GENERATION'])
+    result_cache.invalidate()
+
+
+def check_generation(session, statements):
+    # A lo mas una lectura cada check_interval segundos, no una por consulta
+    if not result_cache.enabled or not result_cache.generation_due():
+        return
+    row = session.execute(statements['SELECT_GENERATION']).one()
+    result_cache.set_generation(row[0] if row else 0)
+
+
+def fetch_rows(session, statements, name, params=None):
+    # Solo para consultas con pocas filas, el resultado completo se guarda en el cache
+    check_generation(session, statements)
+    key = cache.make_key(name, params)
+    rows = result_cache.get(key)
+    if rows is cache.MISSING:
+        rows = list(session.execute(statements[name], params or [], trace=TRACING, execution_profile=profile_for(name)))
+        result_cache.put(key, rows)
+    return rows
+
+def count_flights(session, statements, dimension, value):
+    rows = fetch_rows(session, statements, 'SELECT_FLIGHT_COUNT', [dimension, value])
+    return rows[0][0] if rows else 0
+
+def total_flights(session, statements):
+    rows = fetch_rows(session, statements, 'QUANTITY_ALL')
+    return rows[0][0] if rows else 0
+
+def print_cache_stats():
+    stats = result_cache.stats()
+    print(tabulate([[key, value] for key, value in stats.items()], headers=['Cache', 'Value'], tablefmt='orgtbl'))
+
+def print_percentage(title, filtered_count, total_count):
+    percentage = (filtered_count / total_count) * 100 if total_count else 0
+    print(title)
     print("\n")
     filtered_count_formatted = f"{Fore.WHITE}{Style.BRIGHT}{filtered_count}{Style.RESET_ALL}"
     percentage_value_formatted = f"{Fore.WHITE}{Style.BRIGHT}{percentage:.2f}%{Style.RESET_ALL}"
     print(tabulate([[flights_formatted, filtered_count_formatted], [percentage_formatted, percentage_value_formatted]],tablefmt='fancy_grid'))
 
-def select_by_percentaje_day(session, day):
+def select_by_percentaje_date(session, statements, day, month, year):
+    log.info(f"Retrieving percentage by date: {day}/{month}/{year}")
+    filtered_count = count_flights(session, statements, "date", f"{day}-{month}-{year}")
+    total_count = total_flights(session, statements)
+    print_percentage(f"Percentage by date: {day}/{month}/{year}", filtered_count, total_count)
+
+def select_by_percentaje_day(session, statements, day):
     log.info(f"Retrieving percentage by day: {day}")
-    total_f = session.prepare(QUANTITY_ALL)
-    stmt = session.prepare(SELECT_BY_PERCENTAJE_DAY)
-    total_r = session.execute(total_f)
-    rows = session.execute(stmt, [day])
-    filtered_count = rows.one().filtered_count
-    total_count = total_r.one().total_count
-    percentage = (filtered_count / total_count) * 100
-    print(f"Percentage by day: {day}")
-    print("\n")
-    filtered_count_formatted = f"{Fore.WHITE}{Style.BRIGHT}{filtered_count}{Style.RESET_ALL}"
-    percentage_value_formatted = f"{Fore.WHITE}{Style.BRIGHT}{percentage:.2f}%{Style.RESET_ALL}"
-    print(tabulate([[flights_formatted, filtered_count_formatted], [percentage_formatted, percentage_value_formatted]],tablefmt='fancy_grid'))
+    filtered_count = count_flights(session, statements, "day", str(day))
+    total_count = total_flights(session, statements)
+    print_percentage(f"Percentage by day: {day}", filtered_count, total_count)
 
-def select_by_percentaje_less_wait(session, wait):
+def select_by_percentaje_less_wait(session, statements, wait):
     log.info(f"Retrieving percentage by wait time less or equal to {wait} minutes")
-    total_f = session.prepare(QUANTITY_ALL)
-    stmt = session.prepare(SELECT_BY_PERCENTAJE__LESS_WAIT)
-    rows = session.execute(stmt, [wait])
-    total_r = session.execute(total_f)
-    filtered_count = rows.one().filtered_count
-    total_count = total_r.one().total_count
-    percentage = (filtered_count / total_count) * 100
-    print(f"Percentage by wait time less or equal to {wait} minutes")
-    print("\n")
-    filtered_count_formatted = f"{Fore.WHITE}{Style.BRIGHT}{filtered_count}{Style.RESET_ALL}"
-    percentage_value_formatted = f"{Fore.WHITE}{Style.BRIGHT}{percentage:.2f}%{Style.RESET_ALL}"
-    print(tabulate([[flights_formatted, filtered_count_formatted], [percentage_formatted, percentage_value_formatted]],tablefmt='fancy_grid'))
+    rows = fetch_rows(session, statements, 'SELECT_BY_PERCENTAJE__LESS_WAIT', [wait])
+    filtered_count = sum(flights for flights, in rows)
+    total_count = total_flights(session, statements)
+    print_percentage(f"Percentage by wait time less or equal to {wait} minutes", filtered_count, total_count)
 
-def select_by_percentaje_more_wait(session, wait):
+def select_by_percentaje_more_wait(session, statements, wait):
     log.info(f"Retrieving percentage by wait time more or equal to {wait} minutes")
-    total_f = session.prepare(QUANTITY_ALL)
-    stmt = session.prepare(SELECT_BY_PERCENTAJE__MORE_WAIT)
-    rows = session.execute(stmt, [wait])
-    total_r = session.execute(total_f)
-    filtered_count = rows.one().filtered_count
-    total_count = total_r.one().total_count
-    percentage = (filtered_count / total_count) * 100
-    print(f"Percentage by wait time more or equal to {wait} minutes")
-    print("\n")
-    filtered_count_formatted = f"{Fore.WHITE}{Style.BRIGHT}{filtered_count}{Style.RESET_ALL}"
-    percentage_value_formatted = f"{Fore.WHITE}{Style.BRIGHT}{percentage:.2f}%{Style.RESET_ALL}"
-    print(tabulate([[flights_formatted, filtered_count_formatted], [percentage_formatted, percentage_value_formatted]],tablefmt='fancy_grid'))
+    rows = fetch_rows(session, statements, 'SELECT_BY_PERCENTAJE__MORE_WAIT', [wait])
+    filtered_count = sum(flights for flights, in rows)
+    total_count = total_flights(session, statements)
+    print_percentage(f"Percentage by wait time more or equal to {wait} minutes", filtered_count, total_count)
 
-def select_by_percentaje_to_day(session, day, airport):
+def select_by_percentaje_to_day(session, statements, day, airport):
     log.info(f"Retrieving percentage by airport {airport} on day {day}")
-    stmt = session.prepare(SELECT_BY_PERCENTAJE_TO_DAY)
-    rows = session.execute(stmt, [airport, day])
-    total_f = session.prepare(QUANTITY_ALL)
-    total_r = session.execute(total_f)
-    filtered_count = rows.one().filtered_count
-    total_count = total_r.one().total_count
-    percentage = (filtered_count / total_count) * 100
-    print(f"Percentage by airport {airport} on day {day}")
-    print("\n")
-    filtered_count_formatted = f"{Fore.WHITE}{Style.BRIGHT}{filtered_count}{Style.RESET_ALL}"
-    percentage_value_formatted = f"{Fore.WHITE}{Style.BRIGHT}{percentage:.2f}%{Style.RESET_ALL}"
-    print(tabulate([[flights_formatted, filtered_count_formatted], [percentage_formatted, percentage_value_formatted]],tablefmt='fancy_grid'))
+    filtered_count = count_flights(session, statements, "origin_day", f"{airport}:{day}")
+    total_count = total_flights(session, statements)
+    print_percentage(f"Percentage by airport {airport} on day {day}", filtered_count, total_count)
 
 
-def select_by_percentaje_to_month(session, month, airport):
+def select_by_percentaje_to_month(session, statements, month, airport):
     log.info(f"Retrieving percentage by airport {airport} on month {month}")
-    stmt = session.prepare(SELECT_BY_PERCENTAJE_TO_MONTH)
-    rows = session.execute(stmt, [airport, month])
-    total_f = session.prepare(QUANTITY_ALL)
-    total_r = session.execute(total_f)
-    filtered_count = rows.one().filtered_count
-    total_count = total_r.one().total_count
-    percentage = (filtered_count / total_count) * 100
-    print(f"Percentage by airport {airport} on month {month}")
-    print("\n")
-    filtered_count_formatted = f"{Fore.WHITE}{Style.BRIGHT}{filtered_count}{Style.RESET_ALL}"
-    percentage_value_formatted = f"{Fore.WHITE}{Style.BRIGHT}{percentage:.2f}%{Style.RESET_ALL}"
-    print(tabulate([[flights_formatted, filtered_count_formatted], [percentage_formatted, percentage_value_formatted]],tablefmt='fancy_grid'))
+    filtered_count = count_flights(session, statements, "origin_month", f"{airport}:{month}")
+    total_count = total_flights(session, statements)
+    print_percentage(f"Percentage by airport {airport} on month {month}", filtered_count, total_count)
 
 
-def select_by_percentaje_to_year(session, year, airport):
+def select_by_percentaje_to_year(session, statements, year, airport):
     log.info(f"Retrieving percentage by airport {airport} on year {year}")
-    stmt = session.prepare(SELECT_BY_PERCENTAJE_TO_YEAR)
-    rows = session.execute(stmt, [airport, year])
-    total_f = session.prepare(QUANTITY_ALL)
-    total_r = session.execute(total_f)
-    filtered_count = rows.one().filtered_count
-    total_count = total_r.one().total_count
-    percentage = (filtered_count / total_count) * 100
-    print(f"Percentage by airport {airport} on year {year}")
-    print("\n")
-    filtered_count_formatted = f"{Fore.WHITE}{Style.BRIGHT}{filtered_count}{Style.RESET_ALL}"
-    percentage_value_formatted = f"{Fore.WHITE}{Style.BRIGHT}{percentage:.2f}%{Style.RESET_ALL}"
-    print(tabulate([[flights_formatted, filtered_count_formatted], [percentage_formatted, percentage_value_formatted]],tablefmt='fancy_grid'))
+    filtered_count = count_flights(session, statements, "origin_year", f"{airport}:{year}")
+    total_count = total_flights(session, statements)
+    print_percentage(f"Percentage by airport {airport} on year {year}", filtered_count, total_count)
 
 
-def select_by_percentaje_connection_true(session):
+def select_by_percentaje_connection_true(session, statements):
     log.info("Retrieving percentage of flights with connections")
-    stmt = session.prepare(SELECT_BY_PERCENTAJE_CONNECTION_TRUE)
-    rows = session.execute(stmt)
-    total_f = session.prepare(QUANTITY_ALL)
-    total_r = session.execute(total_f)
-    filtered_count = rows.one().filtered_count
-    total_count = total_r.one().total_count
-    percentage = (filtered_count / total_count) * 100
-    print(f"Percentage of flights with connections")
-    print("\n")
-    filtered_count_formatted = f"{Fore.WHITE}{Style.BRIGHT}{filtered_count}{Style.RESET_ALL}"
-    percentage_value_formatted = f"{Fore.WHITE}{Style.BRIGHT}{percentage:.2f}%{Style.RESET_ALL}"
-    print(tabulate([[flights_formatted, filtered_count_formatted], [percentage_formatted, percentage_value_formatted]],tablefmt='fancy_grid'))
+    filtered_count = count_flights(session, statements, "connection", "True")
+    total_count = total_flights(session, statements)
+    print_percentage("Percentage of flights with connections", filtered_count, total_count)
 
 
-def select_by_percentaje_connection_false(session):
+def select_by_percentaje_connection_false(session, statements):
     log.info("Retrieving percentage of flights without connections")
-    stmt = session.prepare(SELECT_BY_PERCENTAJE_CONNECTION_FALSE)
-    rows = session.execute(stmt)
-    total_f = session.prepare(QUANTITY_ALL)
-    total_r = session.execute(total_f)
-    filtered_count = rows.one().filtered_count
-    total_count = total_r.one().total_count
-    percentage = (filtered_count / total_count) * 100
-    print(f"Percentage of flights without connections")
-    print("\n")
-    filtered_count_formatted = f"{Fore.WHITE}{Style.BRIGHT}{filtered_count}{Style.RESET_ALL}"
-    percentage_value_formatted = f"{Fore.WHITE}{Style.BRIGHT}{percentage:.2f}%{Style.RESET_ALL}"
-    print(tabulate([[flights_formatted, filtered_count_formatted], [percentage_formatted, percentage_value_formatted]],tablefmt='fancy_grid'))
+    filtered_count = count_flights(session, statements, "connection", "False")
+    total_count = total_flights(session, statements)
+    print_percentage("Percentage of flights without connections", filtered_count, total_count)
 
-def select_by_percentaje_airline_date(session, airline, day, month, year):
+def select_by_percentaje_airline_date(session, statements, airline, day, month, year):
     log.info(f"Retrieving percentage of {airline} flights on {day}/{month}/{year}")
-    stmt = session.prepare(SELECT_BY_PERCENTAJE__AIRLINE_DATE)
-    rows = session.execute(stmt, [airline, day, month, year])
-    total_f = session.prepare(QUANTITY_ALL)
-    total_r = session.execute(total_f)
-    filtered_count = rows.one().filtered_count
-    total_count = total_r.one().total_count
-    percentage = (filtered_count / total_count) * 100
-    print(f"Percentage of {airline} flights on {day}/{month}/{year}")
-    print("\n")
-    filtered_count_formatted = f"{Fore.WHITE}{Style.BRIGHT}{filtered_count}{Style.RESET_ALL}"
-    percentage_value_formatted = f"{Fore.WHITE}{Style.BRIGHT}{percentage:.2f}%{Style.RESET_ALL}"
-    print(tabulate([[flights_formatted, filtered_count_formatted], [percentage_formatted, percentage_value_formatted]],tablefmt='fancy_grid'))
+    filtered_count = count_flights(session, statements, "airline_date", f"{airline}:{day}-{month}-{year}")
+    total_count = total_flights(session, statements)
+    print_percentage(f"Percentage of {airline} flights on {day}/{month}/{year}", filtered_count, total_count)
 
-def select_by_query_main(session, year_param, airline):
+def select_by_query_main(session, statements, year_param, airline):
     log.info(f"main query executed")
-    stmt = session.prepare(MAIN_QUERY)
-    rows = session.execute(stmt, [year_param, airline])
-    data = []
-    for row in rows:
-        data.append(row.month)
-    frequencies = collections.Counter(data)
+    rows = fetch_rows(session, statements, 'MAIN_QUERY', [year_param, airline])
+    # Una fila por mes, a lo mas 12
+    print_month_mode(year_param, airline, dict(rows))
+
+def print_month_mode(year_param, airline, frequencies):
+    if not frequencies:
+        print(f"\nNo flights for {airline} in {year_param}\n")
+        return
     mode = max(frequencies, key=frequencies.get)
     year_paramf = f"{Fore.YELLOW}{Style.BRIGHT}{year_param}{Style.RESET_ALL}"
     nombre_de_mes = options.meses_dict[mode]
@@ -566,4 +825,6 @@ def select_by_query_main(session, year_param, airline):
     data_to_print = [[year_paramf, nombre_formatted, frequencies[mode]]]
     print(f"\nMonth with most flights for {airline}\n")
     print(tabulate(data_to_print, headers=['Year', 'Month', 'Number of flights'], tablefmt='orgtbl'))
-
+    distribution = [[options.meses_dict[month], frequencies.get(month, 0)] for month in options.months]
+    print(f"\nFlights per month for {airline} in {year_param}\n")
+    print(tabulate(distribution, headers=['Month', 'Number of flights'], tablefmt='orgtbl'))
@@ -13,6 +13,9 @@ meses_dict = {
     12: "Diciembre"
 }
 
+months = list(range(1, 13))
+days = list(range(1, 32))
+
 
 def print_airlines():
     airlines = ["American Airlines", "Delta Airlines", "Alaska", "Aeromexico", "Volaris"]
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Metricas por sentencia: latencia (p50/p95/p99), filas, paginas y bytes.
+Se registra un listener en la sesion, asi se mide todo lo que pasa por el
+driver (menu, modo por lotes, cargas) sin tocar cada consulta.
+
+La latencia es el tiempo hasta la primera pagina; las paginas siguientes
+dependen de cuando las pida quien consume el resultado. Los bytes enviados
+son exactos, los recibidos son una estimacion a partir de los valores.
+"""
+import collections
+import logging
+import threading
+import time
+
+from tabulate import tabulate
+
+log = logging.getLogger()
+
+# Muestras de latencia que se guardan por sentencia para los percentiles
+SAMPLES = 10000
+
+
+class StatementStats(object):
+
+    def __init__(self):
+        self.latencies = collections.deque(maxlen=SAMPLES)
+        self.requests = 0
+        self.errors = 0
+        self.rows = 0
+        self.pages = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.trace_ids = collections.deque(maxlen=5)
+
+    def percentile(self, fraction):
+        if not self.latencies:
+            return 0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def summary(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "p50_ms": round(self.percentile(0.50) * 1000, 3),
+            "p95_ms": round(self.percentile(0.95) * 1000, 3),
+            "p99_ms": round(self.percentile(0.99) * 1000, 3),
+            "rows": self.rows,
+            "pages": self.pages,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+        }
+
+
+class QueryMetrics(object):
+
+    def __init__(self):
+        self.stats = collections.defaultdict(StatementStats)
+        self.names = {}
+        self._lock = threading.Lock()
+
+    def register(self, statements):
+        # Nombre de cada sentencia preparada a partir de su id
+        for name, prepared in statements.items():
+            self.names[prepared.query_id] = name
+
+    def statement_name(self, query):
+        prepared = getattr(query, "prepared_statement", None)
+        if prepared is not None:
+            return self.names.get(prepared.query_id, prepared.query_string.split()[0])
+        if hasattr(query, "_statements_and_parameters"):
+            return "BATCH"
+        text = getattr(query, "query_string", query)
+        return " ".join(str(text).split()[:2])
+
+    def on_request(self, future):
+        # Se llama en el hilo que crea la consulta, antes de enviarla
+        name = self.statement_name(future.query)
+        start = time.perf_counter()
+        first_page = [True]
+
+        def on_page(rows):
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                stats = self.stats[name]
+                if first_page[0]:
+                    first_page[0] = False
+                    stats.requests += 1
+                    stats.latencies.append(elapsed)
+                    stats.bytes_sent += future.request_encoded_size or 0
+                    stats.trace_ids.extend(future.get_query_trace_ids())
+                stats.pages += 1
+                if rows:
+                    stats.rows += len(rows)
+                    stats.bytes_received += estimate_bytes(rows)
+
+        def on_error(error):
+            with self._lock:
+                self.stats[name].errors += 1
+
+        future.add_callbacks(on_page, on_error)
+
+    def summary(self):
+        with self._lock:
+            return {name: stats.summary() for name, stats in sorted(self.stats.items())}
+
+    def trace_ids(self):
+        with self._lock:
+            return {name: list(stats.trace_ids) for name, stats in self.stats.items() if stats.trace_ids}
+
+    def log_summary(self):
+        for name, summary in self.summary().items():
+            log.info(f"metrics {name}: " + " ".join(f"{key}={value}" for key, value in summary.items()))
+
+
+def estimate_bytes(rows):
+    # Aproximado: longitud de textos y blobs, 4 bytes por entero, 8 por el resto
+    size = 0
+    for row in rows:
+        for value in (row.values() if isinstance(row, dict) else row):
+            if isinstance(value, (str, bytes)):
+                size += len(value)
+            elif isinstance(value, (bool, int)):
+                size += 4
+            elif value is not None:
+                size += 8
+    return size
+
+
+metrics = QueryMetrics()
+
+
+def instrument(session, statements, interval=0):
+    # Listener en la sesion y, si interval > 0, una linea de log cada `interval` segundos
+    metrics.register(statements)
+    session.add_request_init_listener(metrics.on_request)
+    if interval > 0:
+        reporter = threading.Thread(target=report_every, args=(interval,), daemon=True)
+        reporter.start()
+    return metrics
+
+
+def report_every(interval):
+    while True:
+        time.sleep(interval)
+        metrics.log_summary()
+
+
+def driver_stats(cluster):
+    # Metricas del driver (requieren metrics_enabled y el paquete scales)
+    if cluster.metrics is None:
+        return {}
+    stats = cluster.metrics.get_stats()
+    timer = stats.get("request_timer", {})
+    values = {f"request_{key}": value for key, value in timer.items()}
+    for key in ["connection_errors", "write_timeouts", "read_timeouts", "unavailables",
+                "other_errors", "retries", "ignores", "known_hosts", "connected_to", "open_connections"]:
+        if key in stats:
+            values[key] = stats[key]
+    return values
+
+
+def print_stats(cluster=None):
+    summary = metrics.summary()
+    headers = ["Statement", "Requests", "Errors", "p50 ms", "p95 ms", "p99 ms", "Rows", "Pages", "Sent", "Received"]
+    print(tabulate([[name] + list(values.values()) for name, values in summary.items()], headers=headers, tablefmt='orgtbl'))
+    if cluster is not None and cluster.metrics is not None:
+        print("\n")
+        print(tabulate(list(driver_stats(cluster).items()), headers=['Driver', 'Value'], tablefmt='orgtbl'))
+    traces = metrics.trace_ids()
+    if traces:
+        print("\nRecent traces (SELECT * FROM system_traces.events WHERE session_id = <id>):")
+        for name, ids in traces.items():
+            print(name, ", ".join(str(trace_id) for trace_id in ids))
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Rellena las tablas por consulta a partir de airport_wait_time.
+Util cuando los datos se cargaron antes de que existieran esas tablas.
+Con --rollup solo recalcula airline_month_counts con un recorrido en paralelo.
+"""
+import argparse
+import logging
+import os
+
+from cassandra.concurrent import execute_concurrent_with_args
+
+import model
+import scanner
+
+log = logging.getLogger()
+log.setLevel('INFO')
+handler = logging.FileHandler('investments.log')
+handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s"))
+log.addHandler(handler)
+
+CLUSTER_IPS = os.getenv('CASSANDRA_CLUSTER_IPS', 'localhost')
+KEYSPACE = os.getenv('CASSANDRA_KEYSPACE', 'investments')
+COMPRESSION = os.getenv('CASSANDRA_COMPRESSION', 'none')
+LOCAL_DC = os.getenv('CASSANDRA_LOCAL_DC')
+PROTOCOL_VERSION = os.getenv('CASSANDRA_PROTOCOL_VERSION')
+CONNECTIONS_PER_HOST = os.getenv('CASSANDRA_CONNECTIONS_PER_HOST')
+
+
+def rebuild_month_counts(session, statements, workers=None):
+    log.info("Rebuilding airline_month_counts")
+    session.execute("TRUNCATE airline_month_counts", execution_profile=model.ANALYTICS_PROFILE)
+    counts = scanner.scan(scanner.GroupBy(["airline", "year", "month"]), workers=workers).counts
+    execute_concurrent_with_args(session, statements['INCREMENT_MONTH_COUNT'],
+                                 [(flights, *key) for key, flights in counts.items()],
+                                 raise_on_first_error=True)
+    model.data_changed(session, statements)
+    return sum(counts.values())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rollup", action="store_true",
+            help="Only rebuild the airline/year/month rollup used by option 22")
+    parser.add_argument("--workers", type=int,
+            help="Scanner worker processes for --rollup, defaults to the number of cores")
+    args = parser.parse_args()
+
+    cluster = model.create_cluster(CLUSTER_IPS.split(','), COMPRESSION, LOCAL_DC, PROTOCOL_VERSION, CONNECTIONS_PER_HOST)
+    session = cluster.connect(KEYSPACE)
+    model.create_schema(session)
+    statements = model.prepare_statements(session)
+    if args.rollup:
+        count = rebuild_month_counts(session, statements, args.workers)
+        print(f"Rebuilt airline_month_counts with {count} flights")
+    else:
+        count = model.rebuild_query_tables(session, statements)
+        print(f"Rebuilt query tables with {count} flights")
+    cluster.shutdown()
+
+
+if __name__ == '__main__':
+    main()
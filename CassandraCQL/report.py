@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Reporte completo en una sola pasada vectorizada sobre el dataset.
+Calcula todos los porcentajes del menu (fecha, dia, origen y dia/mes/año,
+conexion, aerolinea y fecha, espera menor o mayor a cada valor) y las
+estadisticas de espera por aerolinea y por ruta, en lugar de una consulta
+por cada combinacion.
+
+Las llaves de los porcentajes son las mismas que model.counter_keys usa en
+flight_counts, asi el reporte se puede comparar contra los contadores.
+"""
+import argparse
+import csv
+import json
+import sys
+
+import numpy as np
+
+import columnar
+
+# (seccion, columnas del grupo, como se escribe la llave)
+PERCENTAGE_SECTIONS = [
+    ("date", ["day", "month", "year"], lambda day, month, year: f"{day}-{month}-{year}"),
+    ("day", ["day"], str),
+    ("origin_day", ["de", "day"], lambda de, day: f"{de}:{day}"),
+    ("origin_month", ["de", "month"], lambda de, month: f"{de}:{month}"),
+    ("origin_year", ["de", "year"], lambda de, year: f"{de}:{year}"),
+    ("connection", ["connection"], str),
+    ("airline_date", ["airline", "day", "month", "year"], lambda airline, day, month, year: f"{airline}:{day}-{month}-{year}"),
+]
+
+WAIT_SECTIONS = [
+    ("airline", ["airline"], str),
+    ("route", ["de", "hacia"], lambda de, hacia: f"{de}-{hacia}"),
+]
+
+QUANTILES = [0.5, 0.9, 0.95, 0.99]
+
+CSV_FIELDS = ["section", "key", "flights", "percentage", "mean", "min", "max"]
+
+
+def column_codes(store, column):
+    # Codigos 0..n-1 de una columna y el valor que representa cada codigo
+    values = store.columns[column].astype(np.int64)
+    if column in store.dictionaries:
+        return values, store.dictionaries[column]
+    low, high = int(values.min()), int(values.max())
+    return values - low, np.arange(low, high + 1)
+
+
+def group_keys(store, columns):
+    # Una llave entera por vuelo combinando las columnas del grupo
+    key = np.zeros(len(store), dtype=np.int64)
+    sizes, labels = [], []
+    for column in columns:
+        codes, values = column_codes(store, column)
+        key = key * len(values) + codes
+        sizes.append(len(values))
+        labels.append(values)
+    return key, sizes, labels
+
+
+def decode(groups, sizes, labels, fmt):
+    parts = np.unravel_index(groups, sizes)
+    return [fmt(*(label[i] for label, i in zip(labels, index))) for index in zip(*(p.tolist() for p in parts))]
+
+
+def percentages(store, columns, fmt):
+    key, sizes, labels = group_keys(store, columns)
+    counts = np.bincount(key, minlength=int(np.prod(sizes)))
+    groups = np.flatnonzero(counts)
+    total = len(store)
+    return {name: {"flights": int(n), "percentage": n * 100 / total}
+            for name, n in zip(decode(groups, sizes, labels, fmt), counts[groups].tolist())}
+
+
+def wait_thresholds(store):
+    # Menu 14 y 15: vuelos con espera <= w y >= w para cada espera presente
+    counts = np.bincount(store.columns["wait"].astype(np.int64))
+    at_most = np.cumsum(counts)
+    at_least = at_most[-1] - at_most + counts
+    total = len(store)
+    waits = np.flatnonzero(counts).tolist()
+    at_most, at_least = at_most.tolist(), at_least.tolist()
+    return ({str(w): {"flights": at_most[w], "percentage": at_most[w] * 100 / total} for w in waits},
+            {str(w): {"flights": at_least[w], "percentage": at_least[w] * 100 / total} for w in waits})
+
+
+def wait_stats(store, columns, fmt, mask=None, quantiles=QUANTILES):
+    key, sizes, labels = group_keys(store, columns)
+    wait = store.columns["wait"].astype(np.int64)
+    if mask is not None:
+        key, wait = key[mask], wait[mask]
+    if not len(wait):
+        return {}
+    # Ordenado por grupo y luego por espera, cada grupo queda contiguo
+    order = np.lexsort((wait, key))
+    key, wait = key[order], wait[order]
+    groups, starts, counts = np.unique(key, return_index=True, return_counts=True)
+    stats = {
+        "flights": counts,
+        "mean": np.add.reduceat(wait, starts) / counts,
+        "min": wait[starts],
+        "max": wait[starts + counts - 1],
+    }
+    for q in quantiles:
+        # Interpolacion lineal, igual que numpy.percentile
+        position = q * (counts - 1)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        stats[f"p{q * 100:g}"] = wait[starts + lower] + (wait[starts + upper] - wait[starts + lower]) * (position - lower)
+    names = decode(groups, sizes, labels, fmt)
+    columns = {name: values.tolist() for name, values in stats.items()}
+    return {name: {stat: columns[stat][i] for stat in columns} for i, name in enumerate(names)}
+
+
+def build_report(store, connecting_only=False, quantiles=QUANTILES):
+    report = {"flights": len(store), "percentages": {}, "wait": {}}
+    if not len(store):
+        return report
+    for section, columns, fmt in PERCENTAGE_SECTIONS:
+        report["percentages"][section] = percentages(store, columns, fmt)
+    report["percentages"]["wait_at_most"], report["percentages"]["wait_at_least"] = wait_thresholds(store)
+    # Los vuelos sin conexion tienen espera 0, se pueden dejar fuera de las estadisticas
+    mask = store.eq("connection", "True") if connecting_only else None
+    for section, columns, fmt in WAIT_SECTIONS:
+        report["wait"][section] = wait_stats(store, columns, fmt, mask, quantiles)
+    return report
+
+
+def write_csv(report, out, quantiles=QUANTILES):
+    fields = CSV_FIELDS + [f"p{q * 100:g}" for q in quantiles]
+    writer = csv.DictWriter(out, fieldnames=fields, extrasaction='ignore')
+    writer.writeheader()
+    for kind in ["percentages", "wait"]:
+        for section, rows in report[kind].items():
+            for key, values in rows.items():
+                writer.writerow(dict(values, section=f"{kind}.{section}", key=key))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input",
+            help="CSV or .npz snapshot, defaults to: flight_passengers.csv", default="flight_passengers.csv")
+    parser.add_argument("-o", "--output",
+            help="Output file, defaults to stdout")
+    parser.add_argument("-f", "--format", choices=["json", "csv"],
+            help="Output format, defaults to: json", default="json")
+    parser.add_argument("--percentiles",
+            help="Wait percentiles, defaults to: 50,90,95,99", default="50,90,95,99")
+    parser.add_argument("--connecting-only", action="store_true",
+            help="Wait statistics only over connecting flights (the rest wait 0)")
+    args = parser.parse_args()
+
+    quantiles = [float(p) / 100 for p in args.percentiles.split(",")]
+    report = build_report(columnar.FlightStore.load(args.input), args.connecting_only, quantiles)
+
+    out = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        if args.format == "json":
+            json.dump(report, out, indent=2)
+            out.write("\n")
+        else:
+            write_csv(report, out, quantiles)
+    finally:
+        if args.output:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
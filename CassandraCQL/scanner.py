@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Recorrido completo de una tabla en paralelo por rangos de token.
+El anillo de tokens se divide en sub-rangos que se leen en varios procesos,
+cada uno con su propia conexion, y cada proceso alimenta un agregador.
+Los agregadores parciales se combinan al final.
+"""
+import argparse
+import collections
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from cassandra.query import named_tuple_factory
+
+import model
+
+log = logging.getLogger()
+
+CLUSTER_IPS = os.getenv('CASSANDRA_CLUSTER_IPS', 'localhost')
+KEYSPACE = os.getenv('CASSANDRA_KEYSPACE', 'investments')
+COMPRESSION = os.getenv('CASSANDRA_COMPRESSION', 'none')
+LOCAL_DC = os.getenv('CASSANDRA_LOCAL_DC')
+PROTOCOL_VERSION = os.getenv('CASSANDRA_PROTOCOL_VERSION')
+CONNECTIONS_PER_HOST = os.getenv('CASSANDRA_CONNECTIONS_PER_HOST')
+
+# Perfil analitico con filas con nombre, los agregadores leen columnas por nombre
+SCAN_PROFILE = 'scan'
+
+# Rango de tokens del Murmur3Partitioner
+MIN_TOKEN = -2 ** 63
+MAX_TOKEN = 2 ** 63 - 1
+
+# Conexion y sentencias de cada proceso
+_session = None
+_prepared = {}
+
+
+class MonthMode(object):
+    # Vuelos por mes, opcionalmente para una aerolinea y año
+    columns = ["airline", "year", "month"]
+
+    def __init__(self, airline=None, year=None):
+        self.airline = airline
+        self.year = year
+        self.counts = collections.Counter()
+
+    def add(self, row):
+        if self.airline is not None and row.airline != self.airline:
+            return
+        if self.year is not None and row.year != self.year:
+            return
+        self.counts[row.month] += 1
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+
+    def result(self):
+        if not self.counts:
+            return {"month": None, "flights": 0, "distribution": {}}
+        month, flights = self.counts.most_common(1)[0]
+        return {"month": month, "flights": flights, "distribution": dict(sorted(self.counts.items()))}
+
+
+class WaitStats(object):
+    # Cantidad, promedio, minimo y maximo de espera por grupo
+    def __init__(self, group_by=()):
+        self.group_by = list(group_by)
+        self.columns = self.group_by + ["wait"]
+        self.stats = {}
+
+    def add(self, row):
+        key = tuple(getattr(row, column) for column in self.group_by)
+        count, total, low, high = self.stats.get(key, (0, 0, row.wait, row.wait))
+        self.stats[key] = (count + 1, total + row.wait, min(low, row.wait), max(high, row.wait))
+
+    def merge(self, other):
+        for key, (count, total, low, high) in other.stats.items():
+            if key not in self.stats:
+                self.stats[key] = (count, total, low, high)
+                continue
+            c, t, l, h = self.stats[key]
+            self.stats[key] = (c + count, t + total, min(l, low), max(h, high))
+
+    def result(self):
+        return {"|".join(map(str, key)) or "all": {"flights": count, "mean": total / count, "min": low, "max": high}
+                for key, (count, total, low, high) in self.stats.items()}
+
+
+class GroupBy(object):
+    # Vuelos por combinacion de columnas
+    def __init__(self, group_by):
+        self.columns = list(group_by)
+        self.counts = collections.Counter()
+
+    def add(self, row):
+        self.counts[tuple(getattr(row, column) for column in self.columns)] += 1
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+
+    def result(self):
+        return {"|".join(map(str, key)): flights for key, flights in self.counts.most_common()}
+
+
+def token_ranges(splits):
+    step = (MAX_TOKEN - MIN_TOKEN) // splits
+    bounds = [MIN_TOKEN + i * step for i in range(splits)] + [MAX_TOKEN]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def range_query(table, columns):
+    key = ", ".join(model.PARTITION_KEYS[table])
+    return f"SELECT {', '.join(columns)} FROM {table} WHERE token({key}) > ? AND token({key}) <= ?"
+
+
+def _connect():
+    global _session
+    cluster = model.create_cluster(CLUSTER_IPS.split(','), COMPRESSION, LOCAL_DC, PROTOCOL_VERSION, CONNECTIONS_PER_HOST)
+    cluster.add_execution_profile(SCAN_PROFILE, model.analytics_profile(LOCAL_DC, named_tuple_factory))
+    _session = cluster.connect(KEYSPACE)
+
+
+def _scan_range(query, token_range, aggregator, fetch_size):
+    if query not in _prepared:
+        _prepared[query] = _session.prepare(query)
+    bound = _prepared[query].bind(token_range)
+    bound.fetch_size = fetch_size
+    for row in _session.execute(bound, execution_profile=SCAN_PROFILE):
+        aggregator.add(row)
+    return aggregator
+
+
+def scan(aggregator, table="airport_wait_time", splits=None, workers=None, fetch_size=5000):
+    # Cada sub-rango viaja a un proceso con una copia vacia del agregador
+    workers = workers or os.cpu_count()
+    splits = splits or workers * 8
+    query = range_query(table, aggregator.columns)
+    log.info(f"Scanning {table} in {splits} token ranges with {workers} workers")
+    with ProcessPoolExecutor(max_workers=workers, initializer=_connect) as pool:
+        futures = [pool.submit(_scan_range, query, token_range, aggregator, fetch_size)
+                   for token_range in token_ranges(splits)]
+        partials = [future.result() for future in as_completed(futures)]
+    for partial in partials:
+        aggregator.merge(partial)
+    return aggregator
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("aggregate", choices=["month-mode", "wait-stats", "group-by"],
+            help="Aggregation to compute over the whole table")
+    parser.add_argument("--airline", help="Only for month-mode")
+    parser.add_argument("--year", type=int, help="Only for month-mode")
+    parser.add_argument("--group-by", help="Comma separated columns, e.g. airline,de, required for group-by", default="")
+    parser.add_argument("--splits", type=int, help="Token sub-ranges, defaults to 8 per worker")
+    parser.add_argument("--workers", type=int, help="Worker processes, defaults to the number of cores")
+    args = parser.parse_args()
+
+    group_by = [column for column in args.group_by.split(",") if column]
+    # Sin columnas la consulta seria SELECT  FROM ..., CQL invalido
+    if args.aggregate == "group-by" and not group_by:
+        parser.error("group-by needs --group-by")
+    if args.aggregate == "month-mode":
+        aggregator = MonthMode(args.airline, args.year)
+    elif args.aggregate == "wait-stats":
+        aggregator = WaitStats(group_by)
+    else:
+        aggregator = GroupBy(group_by)
+
+    print(json.dumps(scan(aggregator, splits=args.splits, workers=args.workers).result(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
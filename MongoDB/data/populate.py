@@ -1,17 +1,61 @@
 #!/usr/bin/env python3
+import argparse
+import calendar
 import csv
 import requests
 
 BASE_URL = "http://localhost:8000"
 
+# Nombres de columnas del formato columnar de CassandraCQL/flight_data.py
+COLUMN_NAMES = {"de": "From", "hacia": "to"}
+
+# Filas del formato columnar que se decodifican a la vez
+CHUNK_SIZE = 10000
+
+
+def read_flights(path):
+    if not path.endswith(".npz"):
+        with open(path) as fd:
+            for flight in csv.DictReader(fd):
+                del flight["id"]
+                yield flight
+        return
+    # Formato columnar: codigos en <columna> y valores en <columna>__dict, el mes como numero
+    import numpy as np
+    month_names = np.array(calendar.month_name)
+    with np.load(path, allow_pickle=False) as data:
+        columns = {}
+        for name in data.files:
+            if name.endswith("__dict"):
+                continue
+            dictionary = data[f"{name}__dict"] if f"{name}__dict" in data.files else None
+            if name == "month":
+                dictionary = month_names if dictionary is None else month_names[dictionary]
+            columns[name] = (data[name], dictionary)
+    names = [COLUMN_NAMES.get(name, name) for name in columns]
+    size = len(next(iter(columns.values()))[0]) if columns else 0
+    # Se decodifican CHUNK_SIZE filas a la vez en lugar de todo el archivo
+    for start in range(0, size, CHUNK_SIZE):
+        values = []
+        for codes, dictionary in columns.values():
+            selected = codes[start:start + CHUNK_SIZE]
+            if dictionary is not None:
+                selected = dictionary[selected]
+            values.append(selected.astype(str).tolist())
+        for row in zip(*values):
+            yield dict(zip(names, row))
+
+
 def main():
-    with open("flights.csv") as fd:
-        flights_csv = csv.DictReader(fd)
-        for flight in flights_csv:
-            del flight["id"]
-            x = requests.post(BASE_URL+"/flight", json=flight)
-            if not x.ok:
-                print(f"Failed to post flight {x} - {flight}")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input",
+            help="flights.csv or a .npz generated by flight_data.py, defaults to: flights.csv", default="flights.csv")
+    args = parser.parse_args()
+
+    for flight in read_flights(args.input):
+        x = requests.post(BASE_URL+"/flight", json=flight)
+        if not x.ok:
+            print(f"Failed to post flight {x} - {flight}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,15 +1,182 @@
+import argparse
 import csv
 import os
+import random
+import threading
+import time
 import datetime as date
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 
 from neo4j import GraphDatabase
-from neo4j.exceptions import ConstraintError
+from neo4j.exceptions import TransientError
+
+# Nombres de columnas del formato columnar de CassandraCQL/flight_data.py
+COLUMN_NAMES = {"de": "from", "hacia": "to"}
+
+# Filas por transaccion de escritura
+CHUNK_SIZE = int(os.getenv('NEO4J_CHUNK_SIZE', '1000'))
+
+# Hilos de escritura, con mas de uno se usa la carga paralela
+WORKERS = int(os.getenv('NEO4J_WORKERS', '1'))
+
+# Reintentos de un lote que falla por deadlock u otro error transitorio, con espera exponencial
+RETRIES = int(os.getenv('NEO4J_RETRIES', '5'))
+RETRY_DELAY = 0.1
+
+# Lotes leidos y aun sin escribir por cada hilo en la carga paralela, limita la memoria
+PENDING_PER_WORKER = int(os.getenv('NEO4J_PENDING_PER_WORKER', '2'))
+
+# Restricciones con las mismas llaves que usan los MERGE y MATCH de la carga
+CONSTRAINTS = {
+    "unique_airline": "FOR (ai:Airline) REQUIRE ai.airline_name IS UNIQUE",
+    "unique_airport": "FOR (a:Airport) REQUIRE a.airport_name IS UNIQUE",
+    "unique_flight_key": "FOR (f:Flight) REQUIRE (f.airline, f.date) IS UNIQUE",
+    "unique_date_key": "FOR (d:Date) REQUIRE (d.year, d.month, d.day) IS UNIQUE",
+    "unique_passenger_key": "FOR (p:Passenger) REQUIRE (p.age, p.gender, p.reason, p.stay, p.transit, p.wait) IS UNIQUE",
+}
+
+# Indice de la antigua consulta de frecuencia por aeropuerto, ahora se calcula al leer el archivo
+OBSOLETE_INDEXES = ["passenger_age_wait"]
+
+# Restricciones anteriores con llaves que ninguna consulta usa (year/month/day en Flight, hour en Date, sin wait en Passenger)
+OBSOLETE_CONSTRAINTS = ["unique_flight", "unique_date", "unique_passenger"]
+
+# Operadores que recorren todos los nodos de una etiqueta en lugar de usar un indice
+SCAN_OPERATORS = ["NodeByLabelScan", "AllNodesScan"]
+
+# Llaves de los nodos y de OPERATES_AT, se juntan los valores distintos antes de cargar
+DISTINCT_KEYS = {
+    "airline": ["airline"],
+    "airport": ["airport"],
+    "flight": ["airline", "date"],
+    "date": ["year", "month", "day"],
+    "passenger": ["age", "gender", "reason", "stay", "transit", "wait"],
+    "operates_at": ["airline", "airport"],
+}
+
+# Cada nodo distinto se crea una sola vez
+NODE_QUERIES = {
+    "airline": "UNWIND $rows AS r MERGE (:Airline {airline_name: r.airline})",
+    "airport": "UNWIND $rows AS r MERGE (:Airport {airport_name: r.airport})",
+    "flight": "UNWIND $rows AS r MERGE (:Flight {airline: r.airline, date: r.date})",
+    "date": "UNWIND $rows AS r MERGE (:Date {year: r.year, month: r.month, day: r.day})",
+    "passenger": """UNWIND $rows AS r
+       MERGE (:Passenger {age: r.age, gender: r.gender, reason: r.reason, stay: r.stay, transit: r.transit, wait: r.wait})""",
+}
+
+OPERATES_AT_QUERY = """UNWIND $rows AS r
+       MATCH (ai:Airline {airline_name: r.airline})
+       MATCH (a:Airport {airport_name: r.airport})
+       MERGE (ai)-[:OPERATES_AT]->(a)"""
+
+# Relaciones de cada fila, solo buscan nodos que ya existen
+RELATIONSHIP_QUERIES = {
+    "FROM": """UNWIND $rows AS r
+       MATCH (f:Flight {date: r.date, airline: r.airline})
+       MATCH (a:Airport {airport_name: r.origin})
+       MERGE (f)-[:FROM]->(a)""",
+    "TO": """UNWIND $rows AS r
+       MATCH (f:Flight {date: r.date, airline: r.airline})
+       MATCH (a:Airport {airport_name: r.destination})
+       MERGE (f)-[:TO]->(a)""",
+    "ON_DATE": """UNWIND $rows AS r
+       MATCH (f:Flight {date: r.date, airline: r.airline})
+       MATCH (d:Date {year: r.year, month: r.month, day: r.day})
+       MERGE (f)-[:ON_DATE]->(d)""",
+    "BOARDED": """UNWIND $rows AS r
+       MATCH (f:Flight {date: r.date, airline: r.airline})
+       MATCH (p:Passenger {age: r.age, gender: r.gender, reason: r.reason, stay: r.stay, transit: r.transit, wait: r.wait})
+       MERGE (f)-[:BOARDED]->(p)""",
+}
+
+# Carga paralela: filas con la misma llave van siempre al mismo carril, que escribe un lote a la vez.
+# Solo separa el lado de la llave: un vuelo tiene FROM y TO en varios aeropuertos y un pasajero
+# vuela en varias fechas, asi que dos carriles aun pueden bloquear el mismo nodo y el lote se reintenta
+RELATIONSHIP_PARTITIONS = {"FROM": "origin", "TO": "destination", "ON_DATE": "date", "BOARDED": "date"}
+
+
+def read_flights(source):
+    # Filas como las de csv.DictReader (todos los valores como texto), desde CSV o .npz
+    if not source.endswith(".npz"):
+        with open(source, newline='') as csv_file:
+            yield from csv.DictReader(csv_file, delimiter=',')
+        return
+    import numpy as np
+    with np.load(source, allow_pickle=False) as data:
+        columns = {name: (data[name], data[f"{name}__dict"] if f"{name}__dict" in data.files else None)
+                   for name in data.files if not name.endswith("__dict")}
+    names = [COLUMN_NAMES.get(name, name) for name in columns]
+    size = len(next(iter(columns.values()))[0]) if columns else 0
+    # Se decodifican CHUNK_SIZE filas a la vez, como FlightStore.flights de CassandraCQL/columnar.py
+    for start in range(0, size, CHUNK_SIZE):
+        values = []
+        for codes, dictionary in columns.values():
+            selected = codes[start:start + CHUNK_SIZE]
+            if dictionary is not None:
+                selected = dictionary[selected]
+            values.append(selected.astype(str).tolist())
+        for row in zip(*values):
+            yield dict(zip(names, row))
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def flight_params(r):
+    # Parametros de una fila para las sentencias UNWIND
+    return {
+        "airline": r["airline"], "origin": r["from"], "destination": r["to"],
+        "date": date.date(int(r["year"]), int(r["month"]), int(r["day"])),
+        "year": r["year"], "month": r["month"], "day": r["day"],
+        "age": r["age"], "gender": r["gender"], "reason": r["reason"],
+        "stay": r["stay"], "transit": r["transit"], "wait": r["wait"],
+    }
+
+
+def plan_operators(plan):
+    # Todos los operadores del plan, quitando el sufijo de version (NodeIndexSeek@neo4j)
+    yield plan["operatorType"].split("@")[0]
+    for child in plan.get("children", []):
+        yield from plan_operators(child)
+
+
+def distinct_keys(source):
+    # Primera pasada: valores distintos de cada llave, ordenados, y la frecuencia por aeropuerto
+    keys = {kind: set() for kind in DISTINCT_KEYS}
+    waited = Counter()
+    for r in read_flights(source):
+        params = flight_params(r)
+        for airport in (params["origin"], params["destination"]):
+            keys["airport"].add((airport,))
+            keys["operates_at"].add((params["airline"], airport))
+        for kind in ["airline", "flight", "date", "passenger"]:
+            keys[kind].add(tuple(params[column] for column in DISTINCT_KEYS[kind]))
+        if int(params["wait"]) > 0:
+            waited[params["origin"], params["age"], params["wait"]] += 1
+    # Pasajeros distintos (nodos Passenger) con la misma edad y espera
+    same = Counter((age, wait) for age, gender, reason, stay, transit, wait in keys["passenger"])
+    # Cada fila con espera suma a su aeropuerto de origen los pasajeros con su misma edad y espera
+    frequency = Counter()
+    for (airport, age, wait), rows in waited.items():
+        frequency[airport] += rows * same[age, wait]
+    return ({kind: [dict(zip(DISTINCT_KEYS[kind], key)) for key in sorted(values)] for kind, values in keys.items()},
+            dict(sorted(frequency.items())))
+
 
 class AirlinesApp(object):
 
     def __init__(self, uri, user, password):
         self.driver = GraphDatabase.driver(uri, auth=(user, password))
         self._create_constraints()
+        self._check_plans()
 
 
     def close(self):
@@ -19,160 +186,166 @@ class AirlinesApp(object):
     def _create_constraints(self):
         with self.driver.session() as session:
             #Define the CONSTRAINTS for the airlines data
-            session.run("CREATE CONSTRAINT unique_flight IF NOT EXISTS FOR (f:Flight) REQUIRE (f.airline, f.year, f.month, f.day) IS UNIQUE")
-            session.run("CREATE CONSTRAINT unique_airport IF NOT EXISTS FOR (a:Airport) REQUIRE a.airport_name IS UNIQUE")
-            session.run("CREATE CONSTRAINT unique_date IF NOT EXISTS FOR (d:Date) REQUIRE (d.day, d.month, d.year, d.hour) IS UNIQUE")
-            session.run("CREATE CONSTRAINT unique_passenger IF NOT EXISTS FOR (p:Passenger) REQUIRE (p.age, p.gender, p.reason, p.stay, p.transit) IS UNIQUE")
-            session.run("CREATE CONSTRAINT unique_airline IF NOT EXISTS FOR (ai:Airline) REQUIRE ai.airline_name IS UNIQUE")
-            
-    """
-    Flight -> airline
-    Airport -> airport_name
-    Date -> day, month, year, hour
-    Passenger -> age, gender, reason, stay, transit, wait
-    
-    """  
-    def _create_airline_node(self, airline_name):
-        with self.driver.session() as session:
-            try:
-                session.run("MERGE (ai:Airline {airline_name: $airline_name})", 
-                            airline_name=airline_name)
-            except ConstraintError:
-                pass
+            for name in OBSOLETE_CONSTRAINTS:
+                session.run(f"DROP CONSTRAINT {name} IF EXISTS")
+            for name, definition in CONSTRAINTS.items():
+                session.run(f"CREATE CONSTRAINT {name} IF NOT EXISTS {definition}")
+            for name in OBSOLETE_INDEXES:
+                session.run(f"DROP INDEX {name} IF EXISTS")
+            # El planificador solo usa indices que ya estan en linea
+            session.run("CALL db.awaitIndexes(300)")
 
 
-    def _create_airport_node(self, airport_name):
+    def _check_plans(self):
+        # EXPLAIN de cada consulta de carga, falla si alguna recorre una etiqueta completa
+        queries = list(NODE_QUERIES.values()) + [OPERATES_AT_QUERY] + list(RELATIONSHIP_QUERIES.values())
         with self.driver.session() as session:
-            try:
-                session.run("MERGE (a:Airport {airport_name: $airport_name})", 
-                            airport_name=airport_name)
-            except ConstraintError:
-                pass
+            for query in queries:
+                summary = session.run("EXPLAIN " + query, rows=[]).consume()
+                scans = [operator for operator in plan_operators(summary.plan) if operator in SCAN_OPERATORS]
+                if scans:
+                    raise RuntimeError(f"{', '.join(scans)} in plan for: {' '.join(query.split())}")
 
+    """
+    Flight -> airline, date
+    Airport -> airport_name
+    Date -> day, month, year
+    Passenger -> age, gender, reason, stay, transit, wait
 
-    def _create_flight_node(self, airline, year, month, day):
-        with self.driver.session() as session:
-            try:
-                session.run("MERGE (f:Flight {airline: $airline, date: date($year + '-' + $month + '-' + $day)})",
-                            airline=airline, year=year, month=month, day=day)
-            except ConstraintError:
-                pass
+    """
+    @staticmethod
+    def _load_chunk(tx, queries, rows):
+        # Todas las sentencias del bloque en la misma transaccion
+        for query in queries:
+            tx.run(query, rows=rows).consume()
 
 
-    def _create_date_node(self, year, month, day):
-        with self.driver.session() as session:
+    def _write_batch(self, queries, rows):
+        # Transaccion explicita en su propia sesion, los errores transitorios (deadlocks) se reintentan aqui
+        for attempt in range(RETRIES + 1):
             try:
-                session.run("MERGE (d:Date {year: $year, month: $month, day: $day})", 
-                            year=year, month=month, day=day)
-            except ConstraintError:
-                pass
+                with self.driver.session() as session:
+                    with session.begin_transaction() as tx:
+                        self._load_chunk(tx, queries, rows)
+                        tx.commit()
+                return
+            except TransientError as error:
+                if attempt == RETRIES:
+                    raise
+                delay = RETRY_DELAY * 2 ** attempt * random.uniform(1, 2)
+                print(f"Retrying batch of {len(rows)} rows in {delay:.2f}s: {error.code}")
+                time.sleep(delay)
 
 
-    def _create_passenger_node(self, age, gender, reason, stay, transit, wait):
-        with self.driver.session() as session:
-            try:
-                session.run("MERGE (p:Passenger {age: $age, gender: $gender, reason: $reason, stay:$stay, transit:$transit, wait:$wait})", 
-                            age=age, gender=gender, reason=reason, stay=stay, transit=transit, wait=wait)
-            except ConstraintError:
-                pass
-
+    def _write_partitioned(self, executor, queries, rows, key, chunk_size, workers):
+        # Cada valor de la llave cae siempre en el mismo carril y cada carril escribe un lote a la vez.
+        # Los lotes de un carril ocupado esperan en su cola, la lectura solo se detiene al llegar al
+        # total de lotes pendientes
+        lanes = [[] for _ in range(workers)]
+        queued = [deque() for _ in range(workers)]
+        running = [False] * workers
+        limit = PENDING_PER_WORKER * workers
+        slots = threading.BoundedSemaphore(limit)
+        lock = threading.Lock()
+        errors = []
 
-    def _create_FROM_relationship(self, year, month, day, airport, airline):
-        with self.driver.session() as session:
-            session.run("""
-                MATCH (f:Flight {date:date($year + '-' + $month + '-' + $day), airline:$airline})
-                MATCH (a:Airport {airport_name:$airport_name})
-                MERGE (f)-[r:FROM]->(a)
-                RETURN type(r)""", year=year, month=month, day=day, airport_name=airport, airline=airline)
+        def write(lane, batch):
+            while batch is not None:
+                try:
+                    self._write_batch(queries, batch)
+                except Exception as error:
+                    errors.append(error)
+                finally:
+                    slots.release()
+                with lock:
+                    batch = queued[lane].popleft() if queued[lane] else None
+                    running[lane] = batch is not None
 
+        def submit(lane):
+            if errors:
+                raise errors[0]
+            slots.acquire()
+            batch, lanes[lane] = lanes[lane], []
+            with lock:
+                if running[lane]:
+                    queued[lane].append(batch)
+                    return
+                running[lane] = True
+            executor.submit(write, lane, batch)
 
-    def _create_TO_relationship(self, year, month, day, airport, airline):
-        with self.driver.session() as session:
-            session.run("""
-                MATCH (f:Flight {date:date($year + '-' + $month + '-' + $day), airline:$airline})
-                MATCH (a:Airport {airport_name:$airport_name})
-                MERGE (f)-[r:TO]->(a)
-                RETURN type(r)""", year=year, month=month, day=day, airport_name=airport, airline=airline)
-            
-
-    def _create_ON_DATE_relationship(self, year, month, day):
-        with self.driver.session() as session:
-            session.run("""
-                MATCH (f:Flight {date:date($year + '-' + $month + '-' + $day)})
-                MERGE (d:Date {year:$year, month:$month, day:$day})
-                MERGE (f)-[r:ON_DATE]->(d)
-                RETURN type(r)""", year=year, month=month, day=day)
+        for row in rows:
+            lane = hash(row[key]) % workers
+            lanes[lane].append(row)
+            if len(lanes[lane]) == chunk_size:
+                submit(lane)
+        for lane in range(workers):
+            if lanes[lane]:
+                submit(lane)
+        # Espera a que se escriban todos los lotes
+        for _ in range(limit):
+            slots.acquire()
+        if errors:
+            raise errors[0]
 
 
-    def _create_BOARDED_relationship(self, age, gender, reason, stay, transit, year, month, day):
-        with self.driver.session() as session:
-            session.run("""
-                MATCH (f:Flight {date:date($year + '-' + $month + '-' + $day)})
-                MERGE (p:Passenger {age:$age, gender:$gender, reason:$reason, stay:$stay, transit:$transit})
-                MERGE (f)-[r:BOARDED]->(p)
-                RETURN type(r)""", age=age, gender=gender, reason=reason, stay=stay, transit=transit, year=year, month=month, day=day)
-            
-
-    def _create_OPERATE_AT_relationship(self, airline, airport):
-        with self.driver.session() as session:
-            session.run("""
-                MATCH (a:Airline {airline_name:$airline_name})
-                MATCH (ap:Airport {airport_name:$airport_name})
-                MERGE (a)-[r:OPERATES_AT]->(ap)
-                RETURN type(r)
-            """, airline_name=airline, airport_name=airport)
+    def init_parallel(self, source, chunk_size=CHUNK_SIZE, workers=WORKERS):
+        start = time.perf_counter()
+        keys, frequency = distinct_keys(source)
+        print("Distinct " + ", ".join(f"{kind}: {len(values)}" for kind, values in keys.items()))
+        with ThreadPoolExecutor(workers) as executor:
+            # Los nodos distintos no comparten llaves, cualquier lote puede ir a cualquier hilo
+            futures = [executor.submit(self._write_batch, [query], rows)
+                       for kind, query in NODE_QUERIES.items() for rows in chunks(keys[kind], chunk_size)]
+            for future in futures:
+                future.result()
+            print(f"Nodes created in {time.perf_counter() - start:.1f}s")
+            self._write_partitioned(executor, [OPERATES_AT_QUERY], keys["operates_at"], "airport", chunk_size, workers)
+            # Un tipo de relacion a la vez, cada uno con su propia llave de particion
+            for name, query in RELATIONSHIP_QUERIES.items():
+                rows = (flight_params(r) for r in read_flights(source))
+                self._write_partitioned(executor, [query], rows, RELATIONSHIP_PARTITIONS[name], chunk_size, workers)
+                print(f"{name} relationships created in {time.perf_counter() - start:.1f}s")
+        print(f"Airport frequency: {frequency}")
 
 
-    def _wait_count(self, age, wait, airport, airports):
+    def init(self, source, chunk_size=CHUNK_SIZE, workers=WORKERS):
+        if workers > 1:
+            return self.init_parallel(source, chunk_size, workers)
+        start = time.perf_counter()
+        keys, frequency = distinct_keys(source)
+        print("Distinct " + ", ".join(f"{kind}: {len(values)}" for kind, values in keys.items()))
+        loaded = 0
         with self.driver.session() as session:
-            result = session.run(
-                """
-                MATCH (p:Passenger)
-                WHERE p.age=$age AND p.wait = $wait
-                RETURN p.age, p.wait, COUNT(p) AS count
-                ORDER BY p.age, p.wait
-                """, age=age, wait=wait
-            )
-            for record in result:
-                if int(record['p.wait']) > 0:
-                    print(f"{record['p.age']}  {record['p.wait']} {record['count']} {airport}")
-                    if airport in airports:
-                        airports[airport] += int(record['count'])
-                    else:
-                        airports[airport] = int(record['count'])
-            
-                
-
-    def init(self, source):
-            airports = {}
-            with open(source, newline='') as csv_file:
-                reader = csv.DictReader(csv_file,  delimiter=',')
-                for r in reader:
-                    self._create_airline_node(r["airline"])
-                    self._create_airport_node(r["from"])
-                    self._create_flight_node(r["airline"], r["year"], r["month"], r["day"])
-                    self._create_date_node(r["year"], r["month"], r["day"])
-                    self._create_passenger_node(r["age"], r["gender"], r["reason"], r["stay"], r["transit"], r["wait"])
-                    self._create_OPERATE_AT_relationship(r["airline"], r["from"])
-                    self._create_FROM_relationship(r["year"], r["month"], r["day"], r["from"], r["airline"])
-                    self._create_TO_relationship(r["year"], r["month"], r["day"], r["to"], r["airline"])
-                    self._create_ON_DATE_relationship(r["year"], r["month"], r["day"])
-                    self._create_BOARDED_relationship(r["age"], r["gender"], r["reason"], r["stay"], r["transit"], r["year"], r["month"], r["day"])
-                    self._create_OPERATE_AT_relationship(r["airline"], r["to"])
-                    self._wait_count(r["age"], r["wait"], r["from"], airports)
-            print(f"Airport frequency: {airports}")
-
+            for kind, query in NODE_QUERIES.items():
+                for rows in chunks(keys[kind], chunk_size):
+                    session.execute_write(self._load_chunk, [query], rows)
+            for rows in chunks(keys["operates_at"], chunk_size):
+                session.execute_write(self._load_chunk, [OPERATES_AT_QUERY], rows)
+            print(f"Nodes created in {time.perf_counter() - start:.1f}s")
+            # Segunda pasada: solo relaciones
+            for rows in chunks(read_flights(source), chunk_size):
+                session.execute_write(self._load_chunk, list(RELATIONSHIP_QUERIES.values()), [flight_params(r) for r in rows])
+                loaded += len(rows)
+                print(f"{loaded} rows loaded, {loaded / (time.perf_counter() - start):.0f} rows/s")
+        print(f"Airport frequency: {frequency}")
 
 
 if __name__ == "__main__":
-    data = "data/flight_passengers.csv"
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", nargs="?", choices=["load", "report"], default="load",
+            help="load the data file, or only report its airport frequency without connecting, defaults to: load")
+    args = parser.parse_args()
+
+    # CSV o el formato columnar .npz de flight_data.py
+    data = os.getenv('NEO4J_DATA', 'data/flight_passengers.csv')
     # Read connection env variables
     neo4j_uri = os.getenv('NEO4J_URI', 'bolt://localhost:7687')
     neo4j_user = os.getenv('NEO4J_USER', 'neo4j')
     neo4j_password = os.getenv('NEO4J_PASSWORD', 'formal-pizza-trident-october-donor-9379')
 
-    airlines = AirlinesApp(neo4j_uri, neo4j_user, neo4j_password)
-    airlines.init(data)
-
-    airlines.close()
-
+    if args.command == "report":
+        print(f"Airport frequency: {distinct_keys(data)[1]}")
+    else:
+        airlines = AirlinesApp(neo4j_uri, neo4j_user, neo4j_password)
+        airlines.init(data)
+        airlines.close()